@@ -1,10 +1,26 @@
 import os
 import sqlite3
 import random
-from songs import Song, Artist, Album
+from songs import Song, Artist
 import argparse
 
+import dedup
+import logs
+import manifest
+import metrics
+import page_cache
+from sql_util import commit, connect_readonly, enable_wal, record, set_group_commit, GROUP_COMMIT
+
 TEXT_END = '<|endoftext|>'
+
+# full text index over song names and lyrics, reading its content from songs
+CREATE_SONGS_FTS = """
+CREATE VIRTUAL TABLE SONGS_FTS
+       USING fts5(name, lyrics, content = 'songs', content_rowid = 'id', tokenize = 'porter unicode61');
+"""
+INSERT_SONGS_FTS = """INSERT INTO SONGS_FTS (rowid, name, lyrics) VALUES (?, ?, ?);"""
+log = logs.get('azlyrics')
+
 ARTISTS = [
     Artist('cohen', 'leonardcohen'),
     Artist('dylan', 'bobdylan'),
@@ -18,38 +34,74 @@ def main():
     parser.add_argument("-w", "--write", action="store_true", help="write database to output txt file")
     parser.add_argument("-d", "--database", type=str, help="database name", default='songs.db')
     parser.add_argument("-o", "--out", type=str, help="out file", default='out/songs.txt')
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="append only songs added since the last write to out")
+    parser.add_argument("--no_duplicates", action="store_true", help="leave near-duplicate songs out of the write")
+    parser.add_argument("--commit_every", type=int, default=GROUP_COMMIT, help="songs written per transaction")
+    page_cache.add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    logs.add_log_arguments(parser)
 
     args = parser.parse_args()
+    logs.configure_from_args(args)
+    if not args.skip_scrape:
+        # only scraping needs the HTTP stack, --skip_scrape --write runs start without it
+        import http_session
+        http_session.install_cache(page_cache.cache_from_args(args))
+    set_group_commit(args.commit_every)
     db_file = args.database
 
     if args.fresh and os.path.exists(db_file):
         conn = sqlite3.connect(db_file, isolation_level=None)
         cursor = conn.cursor()
         drop_tables(cursor)
-        os.remove(db_file)
-        print(f'deleted {db_file}')
         conn.commit()
         cursor.close()
-
-    conn = sqlite3.connect(db_file, isolation_level=None)
-    cursor = conn.cursor()
-    create_tables(cursor)
+        conn.close()
+        for path in [db_file, db_file + '-wal', db_file + '-shm']:
+            if os.path.exists(path):
+                os.remove(path)
+        log.info(f'deleted {db_file}')
+
+    if args.skip_scrape and not args.no_duplicates:
+        # an export only run leaves the database as it is, no WAL files or new tables
+        try:
+            conn = connect_readonly(db_file)
+        except sqlite3.OperationalError as err:
+            parser.error(f"can't open {db_file}: {err}")
+        cursor = conn.cursor()
+    else:
+        conn = sqlite3.connect(db_file, isolation_level=None)  # transactions are managed by sql_util.record
+        cursor = conn.cursor()
+        enable_wal(cursor)
+        create_tables(cursor)
 
     if not args.skip_scrape:
-        scrape_artists(ARTISTS, cursor)
+        try:
+            scrape_artists(ARTISTS, cursor)
+        finally:
+            commit(cursor)
 
     if args.write:
-        songs = songs_from_db(cursor)
-        write_to(args.out, songs)
+        write_songs(args.out, db_file, cursor, incremental=args.incremental, unique=args.no_duplicates)
 
     conn.commit()
     cursor.close()
+    if not args.skip_scrape:
+        http_session.print_stats()
+        summary = metrics.report()
+        if summary:
+            log.info(summary)
+    if args.metrics:
+        metrics.write(args.metrics)
+        log.info(f'⚙ wrote metrics to {args.metrics}')
 
 
 def scrape_artists(artists, cursor):
     for artist in artists:
         albums, total = scrape_albums(artist, cursor)
-        print(f'☛ {artist.artist_name} ✯ {len(albums)} albums ✯ {total} songs')
+        log.info(f'☛ {artist.artist_name} ✯ {len(albums)} albums ✯ {total} songs',
+                 extra={'artist': artist.artist_name, 'albums': len(albums), 'songs': total})
 
 
 def _song_exists(name, artist, cursor):
@@ -61,23 +113,30 @@ def scrape_albums(artist, cursor):
     res = []
     count = 0
     artist_name = artist.get_song_page_name()
-    for album in artist.get_album_infos():
-        album = Album(artist.artist_name, album)
+    for album in artist.get_albums():
         res.append(album)
-        print(f'{album.title} [{len(album.songs)}]')
+        log.info(f'{album.title} [{len(album.songs)}]', extra={'album': album.title})
         for song_name in album.songs:
             count = count + 1
             if _song_exists(song_name, artist_name, cursor):
-                print(f' ↛ {song_name} [skip]')
+                log.info(f' ↛ {song_name} [skip]', extra={'song': song_name})
             else:
                 song = Song(artist_name, song_name)
-                _insert_song(song, album, cursor)
+                with metrics.stage('write'), record(cursor):
+                    duplicate_of = _insert_song(song, album, cursor)
+                if duplicate_of is not None:
+                    log.info(f' ≈ {song_name} [near-duplicate of {duplicate_of}]',
+                             extra={'song': song_name, 'duplicate_of': duplicate_of})
     return res, count
 
 
 def _insert_song(s, album, cursor):
     row = (s.song_name, s.artist_name, album.type, album.title, album.year, s.lyrics)
     cursor.execute("INSERT INTO songs (name, artist, url, type, year, lyrics) VALUES (?, ?, ?, ?, ?, ?);", row)
+    song_id = cursor.lastrowid
+    cursor.execute(INSERT_SONGS_FTS, (song_id, s.song_name, s.lyrics))
+    metrics.count('db_rows', 2)
+    return dedup.fingerprint(cursor, song_id, s.lyrics)
 
 
 def create_tables(cursor):
@@ -91,34 +150,75 @@ def create_tables(cursor):
            year INTEGER,
            lyrics VARCHAR(256)
            );""")
+    cursor.execute("""CREATE INDEX IF NOT EXISTS SONGS_NAME_ARTIST ON songs (name, artist);""")
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'SONGS_FTS';").fetchone():
+        cursor.execute(CREATE_SONGS_FTS)
+        cursor.execute("INSERT INTO SONGS_FTS (SONGS_FTS) VALUES ('rebuild');")
+    dedup.create_tables(cursor)
 
 
 def drop_tables(cursor):
-    for table in ['SONGS']:
+    for table in ['SONGS', 'SONGS_FTS', 'FINGERPRINTS', 'FINGERPRINT_BANDS']:
         cursor.execute(f'DROP TABLE IF EXISTS {table}')
 
 
-def write_to(filename, songs, shuffle=True):
+def write_songs(filename, db_file, cursor, incremental=False, unique=False):
+    """
+    Writes the songs in cursor to filename and records the highest id written in its
+    manifest. When incremental and the manifest still matches filename, only songs
+    with a higher id are appended. When unique, near-duplicates are left out
+    """
+    latest = cursor.execute("SELECT coalesce(max(id), 0) FROM songs;").fetchone()[0]
+    filters = {'unique': True} if unique else {}
+    if unique:
+        dedup.fingerprint_missing(cursor, 'songs')
+    previous = manifest.load(filename, db_file, filters) if incremental else None
+    after = previous['last_id'] if previous else 0
+    if previous and after >= latest:
+        log.info(f'✓ {filename} is up to date [{previous["count"]} songs]')
+        return
+    songs = songs_from_db(cursor, after, latest, unique)
+    if songs is None:
+        return
+    write_to(filename, songs, append=bool(previous))
+    manifest.save(filename, db_file, latest, len(songs) + (previous['count'] if previous else 0), filters)
+
+
+def write_to(filename, songs, shuffle=True, append=False):
     overwrote = False
-    if os.path.exists(filename):
+    separate = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+    if not append and os.path.exists(filename):
         os.remove(filename)
+        overwrote = True
 
-    f = open(filename, "w")
+    f = open(filename, "a" if append else "w")
     if shuffle:
         random.shuffle(songs)
+    if separate and songs:
+        f.write('\n')
     f.write('\n'.join([f'{s.song_name}\n\n\n{s.lyrics}\n\n\n{TEXT_END}' for s in songs]))
     f.close()
-    if overwrote:
-        print(f'✍︎ overwrote {filename} [{len(songs)} songs]')
+    if append:
+        log.info(f'✍︎ appended to {filename} [{len(songs)} songs]')
+    elif overwrote:
+        log.info(f'✍︎ overwrote {filename} [{len(songs)} songs]')
     else:
-        print(f'✍︎ wrote to {filename} [{len(songs)} songs]')
-
-
-def songs_from_db(cursor):
-    statement = "SELECT name, artist, lyrics from songs;"
-    results = cursor.execute(statement).fetchall()
+        log.info(f'✍︎ wrote to {filename} [{len(songs)} songs]')
+
+
+def songs_from_db(cursor, after_id=0, upto_id=None, unique=False):
+    """
+    Returns the songs with after_id < id <= upto_id, all songs by default. When
+    unique, songs flagged as near-duplicates are left out
+    """
+    statement = "SELECT name, artist, lyrics from songs WHERE id > ? AND id <= ?"
+    if unique:
+        statement += """ AND id NOT IN (SELECT id FROM FINGERPRINTS WHERE duplicate_of IS NOT NULL)"""
+    statement += ";"
+    upto_id = upto_id if upto_id is not None else 2 ** 63 - 1
+    results = cursor.execute(statement, (after_id, upto_id)).fetchall()
     if not results:
-        print("query for songs failed")
+        log.warning("query for songs failed")
         return None
     songs = []
     for name, artist, lyrics in results:
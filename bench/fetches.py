@@ -0,0 +1,123 @@
+"""
+Concurrent fetch check. Poets and a tagged collection are scraped through
+add_poet_poems and add_poem_collection from pages replayed by a local fixture
+server, once one page at a time and once with concurrent fetches. One poem page
+answers 503 the first time it is asked for in each run, so it has to be retried.
+The run fails unless both runs store the same poems
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fetch  # noqa: E402
+import fixtures  # noqa: E402
+import http_session  # noqa: E402
+import logs  # noqa: E402
+import pipeline  # noqa: E402
+import scrape  # noqa: E402
+import sql_util  # noqa: E402
+
+COLLECTION_ID = 1
+COLLECTION_TAGS = 'fixtures,check'
+
+SELECT_STORED = """
+SELECT PT.poet_name, PM.poem_name, PM.translator, PM.source, PM.year, PM.url,
+       (SELECT group_concat(poem_line, char(10))
+        FROM (SELECT poem_line FROM LINES WHERE LINES.pid = PM.pid ORDER BY lid)),
+       (SELECT group_concat(name, ',') FROM (SELECT name FROM TAGS WHERE TAGS.pid = PM.pid ORDER BY name))
+FROM POEMS AS PM
+         JOIN POETS AS PT ON PT.pid = PM.poet_id;
+"""
+
+
+def poem_paths(directory, poet):
+    """
+    Returns the paths of the poem pages linked from a rendered poet page
+    """
+    with open(os.path.join(directory, 'poets', scrape.poet_name_to_dashes(poet)), encoding='utf-8') as f:
+        return [urlsplit(url).path for url in re.findall(r'href="([^"]+)"', f.read())]
+
+
+def scrape_into(path, poets, workers, per_host):
+    """
+    Scrapes poets and the fixture collection into a new database at path with the
+    given fetch concurrency. Returns the stored poems as sorted rows and the number
+    of throttled requests that were retried
+    """
+    conn, cursor = fixtures.scrape_database(path)
+    fixtures.fresh_session()
+    fetch.configure(workers=workers, per_host=per_host)
+    for poet in poets:
+        scrape.add_poet_poems(poet, cursor)
+    scrape.add_poem_collection(COLLECTION_ID, COLLECTION_TAGS, cursor)
+    sql_util.commit(cursor)
+    rows = sorted(cursor.execute(SELECT_STORED).fetchall(), key=repr)
+    conn.close()
+    return rows, http_session.SESSION.stats().get('throttled', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=fixtures.SNAPSHOT, help="poems database to render")
+    parser.add_argument("--poets", type=int, default=5, help="poets rendered, the last only through the collection")
+    parser.add_argument("-w", "--workers", type=int, default=fetch.WORKERS, help="concurrent fetches")
+    parser.add_argument("--per_host", type=int, default=fetch.PER_HOST, help="max concurrent requests per host")
+    parser.add_argument("-p", "--parse_procs", type=int, default=pipeline.PROCS, help="parse processes")
+
+    args = parser.parse_args()
+    # find_poem logs every title it parses
+    logs.configure('WARNING')
+    pipeline.configure(procs=args.parse_procs)
+    tmp = tempfile.mkdtemp()
+    try:
+        fixture_dir = os.path.join(tmp, 'pages')
+        poets = fixtures.render_poets(args.database, fixture_dir, args.poets)
+        if len(poets) < 2:
+            sys.exit(f'{args.database} has too few poets to render a collection from')
+        scraped, collected = poets[:-1], poets[-1]
+        # the collection holds poems not stored yet and one already stored, which only gains the tags
+        paths = poem_paths(fixture_dir, collected) + poem_paths(fixture_dir, scraped[0])[:1]
+        fixtures.render_collection(fixture_dir, COLLECTION_ID, paths)
+        failing = poem_paths(fixture_dir, scraped[0])[-1]
+
+        results = {}
+        with fixtures.FixtureServer(fixture_dir) as server:
+            scrape.POET_URL = server.url + "/poets/%s#about"
+            scrape.COLLECTION_URL = server.url + "/collections/%s"
+            for name, workers, per_host in [('sequential', 1, 1), ('concurrent', args.workers, args.per_host)]:
+                server.fail_next(failing)
+                before = len(server.failed)
+                rows, retries = scrape_into(os.path.join(tmp, f'{name}.db'), scraped, workers, per_host)
+                results[name] = rows
+                print(f"⇅ {name:<12}{len(rows)} poems, {len(server.failed) - before} failed pages, "
+                      f"{retries} retries")
+                stored = any(urlsplit(row[5]).path == failing for row in rows)
+                if not retries or len(server.failed) == before or not stored:
+                    sys.exit(f"{failing} did not fail and get retried in the {name} run")
+        pipeline.shutdown()
+    finally:
+        shutil.rmtree(tmp)
+
+    sequential, concurrent = results['sequential'], results['concurrent']
+    missing = [row[:2] for row in sequential if row not in concurrent]
+    extra = [row[:2] for row in concurrent if row not in sequential]
+    for poet, title in missing:
+        print(f"✗ only sequential: {title} by {poet.strip()}")
+    for poet, title in extra:
+        print(f"✗ only concurrent: {title} by {poet.strip()}")
+    if missing or extra or not any(row[7] for row in concurrent):
+        sys.exit("the concurrent run stored different poems or tags than the sequential run")
+    print(f"✓ {len(concurrent)} poems stored the same concurrently and sequentially")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Saved poetryfoundation and azlyrics pages for the benchmarks, a local HTTP
+server that replays them, and the session and database setup of a scrape against
+it. Pages live in a directory laid out by URL path. They
+are either rendered from the poems and songs databases in the markup the scrapers
+parse, or dumped from a page cache filled by a real scrape with --cache. Links
+to the real sites are pointed at the server as pages are served
+"""
+
+from __future__ import print_function
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import html
+import http.server
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import azlyrics  # noqa: E402
+import http_session  # noqa: E402
+import page_cache  # noqa: E402
+import scrape  # noqa: E402
+import songs  # noqa: E402
+import sql_util  # noqa: E402
+import store  # noqa: E402
+from rate_limit import RateLimiter  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT = os.path.join(ROOT, "db_snapshots", "05-18-full-SNAP.db")
+SONGS = os.path.join(ROOT, "songs.db")
+
+# the fixture server is local, so the per-host rate limits would only measure
+# themselves, and a throttled page is retried without waiting
+UNLIMITED = (1e6, 1e6, 1e6)
+
+# poets with the most poems in the database, rendered with all their poems
+SELECT_TOP_POETS = """
+SELECT PT.pid, PT.poet_name, PT.born, PT.died
+FROM POETS AS PT
+         JOIN POEMS AS PM ON PM.poet_id = PT.pid
+GROUP BY PT.pid
+ORDER BY count(*) DESC, PT.pid
+LIMIT ?;
+"""
+SELECT_POET_POEMS = """
+SELECT PM.pid, PM.poem_name, PM.translator, PM.source,
+       (SELECT group_concat(poem_line, char(10))
+        FROM (SELECT poem_line FROM LINES WHERE LINES.pid = PM.pid ORDER BY lid))
+FROM POEMS AS PM
+WHERE PM.poet_id = ?
+ORDER BY PM.pid;
+"""
+POETRY_URL = "https://www.poetryfoundation.org"
+# sites whose absolute links are rewritten to the fixture server
+REPLAYED_SITES = [POETRY_URL.encode(), b"http://www.azlyrics.com", b"https://www.azlyrics.com"]
+
+SELECT_ARTIST_SONGS = """SELECT name, url, type, year, lyrics FROM songs WHERE artist = ? ORDER BY id;"""
+
+COLLECTION_PAGE = """<!DOCTYPE html><html><head><title>{name}</title></head><body>
+<h1>{name}</h1><ul>{links}</ul></body></html>"""
+POET_PAGE = """<!DOCTYPE html><html><head><title>{name}</title></head><body>
+<h1>{name}</h1><span class="c-txt c-txt_poetMeta">{years}</span>
+<ul>{links}</ul></body></html>"""
+POEM_PAGE = """<!DOCTYPE html><html><head><title>{title}</title></head><body>
+<article><h1>{title}</h1>
+<span class="c-txt c-txt_attribution">By {author}</span>{translator}
+<div class="o-poem">{lines}</div>{source}</article></body></html>"""
+ARTIST_PAGE = """<!DOCTYPE html><html><head><title>{name}</title></head><body>
+<div id="listAlbum">{albums}</div></body></html>"""
+# the scraper reads the lyrics from the 22nd div and skips its first two text nodes
+SONG_PAGE = """<!DOCTYPE html><html><head><title>{name}</title></head><body>{padding}<div>
+<!-- lyrics -->
+{lyrics}</div></body></html>"""
+
+
+def _write(directory, path, body):
+    target = os.path.join(directory, path.lstrip('/'))
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        f.write(body)
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def fresh_session():
+    """
+    Replaces the shared http_session.SESSION with one that doesn't rate limit
+    """
+    http_session.SESSION.close()
+    http_session.SESSION = http_session.Session(limiter=RateLimiter({}, UNLIMITED))
+
+
+def connect(path):
+    conn = sqlite3.connect(path, isolation_level=None)
+    cursor = conn.cursor()
+    sql_util.enable_wal(cursor)
+    return conn, cursor
+
+
+def scrape_database(path):
+    """
+    Returns (conn, cursor) of a poems database at path with its tables created,
+    ready to scrape into
+    """
+    conn, cursor = connect(path)
+    with quiet():
+        store.create_tables(cursor)
+    # the stored url set is loaded once per process, start each run empty
+    store.STORED_URLS = None
+    store.load_poem_urls(cursor)
+    return conn, cursor
+
+
+def render_poets(database, directory, poets=5):
+    """
+    Renders the poet and poem pages of the poets with the most poems in database
+    under directory. Returns the poet names
+    """
+    conn = sqlite3.connect(database)
+    names = []
+    for pid, name, born, died in conn.execute(SELECT_TOP_POETS, (poets,)).fetchall():
+        name = name.strip()
+        dashes = scrape.poet_name_to_dashes(name)
+        links = []
+        for poem_id, title, translator, source, text in conn.execute(SELECT_POET_POEMS, (pid,)):
+            path = f'/poems/{poem_id}/{scrape.poet_name_to_dashes(title or "untitled")}'
+            links.append(f'<li><a href="{POETRY_URL}{path}">{html.escape(title or "")}</a></li>')
+            _write(directory, path, POEM_PAGE.format(
+                title=html.escape(title or ""),
+                author=html.escape(name),
+                translator=f'<span class="c-txt c-txt_attribution">Translated By {html.escape(translator)}</span>'
+                if translator else '',
+                lines=''.join(f'<div>{html.escape(line)}</div>' for line in (text or '').split('\n')),
+                source=f'<span class="c-txt c-txt_note">Source: {html.escape(source)}</span>' if source else ''))
+        years = '-'.join(str(year) for year in (born, died) if year)
+        _write(directory, f'/poets/{dashes}', POET_PAGE.format(name=html.escape(name), years=years,
+                                                               links=''.join(links)))
+        names.append(name)
+    conn.close()
+    return names
+
+
+def render_collection(directory, collection_id, poem_paths, name=None):
+    """
+    Renders a collection page under directory linking to the poem pages at
+    poem_paths
+    """
+    links = ''.join(f'<li><a href="{POETRY_URL}{path}">{html.escape(path)}</a></li>' for path in poem_paths)
+    _write(directory, f'/collections/{collection_id}',
+           COLLECTION_PAGE.format(name=html.escape(name or f'collection {collection_id}'), links=links))
+
+
+def render_artist(database, directory, artist):
+    """
+    Renders the index and song pages of an Artist from a songs database under
+    directory. Returns the number of songs rendered
+    """
+    conn = sqlite3.connect(database)
+    rows = conn.execute(SELECT_ARTIST_SONGS, (artist.get_song_page_name(),)).fetchall()
+    conn.close()
+    # songs rows keep the album type in url and the album title in type
+    albums = {}
+    for name, album_type, album_title, year, lyrics in rows:
+        albums.setdefault((album_type, album_title, year), []).append((name, lyrics))
+    parts = []
+    for (album_type, album_title, year), album_songs in albums.items():
+        if album_type is None:
+            header = 'other songs:'
+        else:
+            header = f'{album_type}: <b>"{html.escape(album_title)}"</b> ({year})'
+        parts.append(f'<div class="album">{header}</div>')
+        for name, lyrics in album_songs:
+            song = songs.Song(artist.get_song_page_name(), name, lyrics or '\n')
+            path = urlsplit(song.get_song_url()).path
+            parts.append(f'<a href="{path}" target="_blank">{html.escape(name)}</a><br>')
+            _write(directory, path, SONG_PAGE.format(
+                name=html.escape(name), padding='<div></div>' * 21,
+                lyrics='<br>\n'.join(html.escape(line) for line in (lyrics or '').split('\n'))))
+    index = urlsplit(artist.get_song_list_url()).path
+    _write(directory, index, ARTIST_PAGE.format(name=html.escape(artist.artist_name), albums=''.join(parts)))
+    return len(rows)
+
+
+def saved_poets(directory):
+    """
+    Returns the names of the poets with a page under directory
+    """
+    poets = os.path.join(directory, 'poets')
+    return sorted(os.listdir(poets)) if os.path.isdir(poets) else []
+
+
+def dump_cache(cache_path, directory):
+    """
+    Writes every page in a page cache under directory by its URL path. Returns the
+    number of pages written
+    """
+    cache = page_cache.PageCache(cache_path)
+    count = 0
+    for url, body in cache.pages():
+        path = urlsplit(url).path or '/'
+        target = os.path.join(directory, path.lstrip('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(body)
+        count += 1
+    return count
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, don't let them wait on delayed acks
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            fail = self.path in self.server.fail_next
+            self.server.fail_next.discard(self.path)
+        if fail:
+            self.server.failed.append(self.path)
+            return self._send(503, b'unavailable')
+        path = os.path.normpath(os.path.join(self.server.directory, urlsplit(self.path).path.lstrip('/')))
+        if not path.startswith(self.server.directory) or not os.path.isfile(path):
+            return self._send(404, b'not found')
+        with open(path, 'rb') as f:
+            body = f.read()
+        for site in REPLAYED_SITES:
+            body = body.replace(site, self.server.url)
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if self.headers.get('If-None-Match') == etag:
+            return self._send(304, b'', {'ETag': etag})
+        headers = {'ETag': etag, 'Content-Type': 'text/html; charset=utf-8'}
+        accept = self.headers.get('Accept-Encoding', '')
+        if 'gzip' in accept:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        elif 'deflate' in accept:
+            body = zlib.compress(body)
+            headers['Content-Encoding'] = 'deflate'
+        self._send(200, body, headers)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FixtureServer(object):
+    """
+    Serves a fixture directory on localhost from a background thread, with ETags
+    and gzip like the real sites. Paths given to fail_next answer their next
+    request with a 503
+    """
+
+    def __init__(self, directory, port=0):
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.directory = os.path.abspath(directory)
+        self.httpd.url = self.url.encode()
+        self.httpd.lock = threading.Lock()
+        self.httpd.fail_next = set()
+        self.httpd.failed = []
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def fail_next(self, *paths):
+        with self.httpd.lock:
+            self.httpd.fail_next.update(paths)
+
+    @property
+    def failed(self):
+        """
+        The paths answered with a 503 so far
+        """
+        return self.httpd.failed
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory", type=str, help="fixture directory to write or serve")
+    parser.add_argument("--from_cache", type=str, help="dump the pages of this page cache")
+    parser.add_argument("--render", action="store_true", help="render pages from the poems and songs databases")
+    parser.add_argument("-d", "--database", type=str, default=SNAPSHOT, help="poems database to render")
+    parser.add_argument("-s", "--songs", type=str, default=SONGS, help="songs database to render")
+    parser.add_argument("--poets", type=int, default=5, help="poets to render")
+    parser.add_argument("--serve", action="store_true", help="serve directory until interrupted")
+    parser.add_argument("--port", type=int, default=8000, help="port to serve on")
+
+    args = parser.parse_args()
+    if args.from_cache:
+        print(f'✍︎ wrote {dump_cache(args.from_cache, args.directory)} pages to {args.directory}')
+    if args.render:
+        poets = render_poets(args.database, args.directory, args.poets)
+        count = render_artist(args.songs, args.directory, azlyrics.ARTISTS[0]) if os.path.exists(args.songs) else 0
+        print(f'✍︎ rendered {len(poets)} poets and {count} songs to {args.directory}')
+    if args.serve:
+        with FixtureServer(args.directory, args.port) as server:
+            print(f'serving {args.directory} on {server.url}')
+            try:
+                server.thread.join()
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Cold start check for the command line modules. Each module is imported in a
+fresh interpreter under python -X importtime, its cumulative import time is
+printed, and the run fails if a module loads something it should only load
+once it scrapes, like bs4 and lxml for the read and export paths
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PARSERS = ('bs4', 'lxml', 'soupsieve', 'html5lib')
+HTTP = ('http.client', 'urllib.request')
+POOLS = ('concurrent.futures', 'multiprocessing')
+
+# module: packages it must not import at load time
+CHECKS = {
+    'sql_util': PARSERS + HTTP + POOLS,
+    'store': PARSERS + HTTP + POOLS,
+    'read': PARSERS + HTTP + POOLS,
+    'search': PARSERS + HTTP + POOLS,
+    'snapshot': PARSERS + HTTP + POOLS,
+    'dedup': PARSERS + HTTP + POOLS,
+    'export': PARSERS + HTTP + POOLS,
+    'songs': PARSERS + HTTP + POOLS,
+    'azlyrics': PARSERS + HTTP + POOLS,
+    'serve': PARSERS + POOLS,
+    'scrape': PARSERS,
+}
+
+
+def import_times(module):
+    """
+    Returns the cumulative microseconds of each module imported by importing module
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def check(module, forbidden, repeat):
+    """
+    Returns the best cumulative import time of module in milliseconds and the
+    forbidden packages it imported
+    """
+    best = None
+    for _ in range(repeat):
+        times = import_times(module)
+        best = times[module] if best is None else min(best, times[module])
+    loaded = sorted(name for name in times
+                    if any(name == package or name.startswith(package + '.') for package in forbidden))
+    return best / 1000, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs='*', help="modules to check, all of CHECKS by default")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="imports per module, best kept")
+
+    args = parser.parse_args()
+    failed = []
+    for module in args.modules or CHECKS:
+        ms, loaded = check(module, CHECKS.get(module, PARSERS), args.repeat)
+        print(f"{module:<12}{ms:>8.1f}ms  " + ("✓" if not loaded else "✗ loads " + ", ".join(loaded)))
+        if loaded:
+            failed.append(module)
+    if failed:
+        sys.exit(f"{len(failed)} modules import more than they need: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Load test for the random poem service. Client processes each hold a keep-alive
+connection and request poems as fast as they are answered for a fixed time, then
+the requests per second and latency quantiles of all of them are printed. Without
+--url or --socket a service is started on a copy of the snapshot database
+"""
+
+from __future__ import print_function
+
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures  # noqa: E402
+import sql_util  # noqa: E402
+from metrics import Histogram  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# local requests take well under a millisecond
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def connect(url=None, unix_socket=None):
+    if unix_socket:
+        return UnixHTTPConnection(unix_socket)
+    parts = urlsplit(url)
+    return http.client.HTTPConnection(parts.hostname, parts.port)
+
+
+def client(task):
+    """
+    Requests paths round robin for seconds over one connection. Returns the latency
+    bucket counts, the number of requests and how many did not answer 200
+    """
+    url, unix_socket, paths, seconds = task
+    conn = connect(url, unix_socket)
+    latency = Histogram(LATENCY_BUCKETS)
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while True:
+        start = time.perf_counter()
+        if start >= deadline:
+            break
+        conn.request('GET', paths[i % len(paths)])
+        response = conn.getresponse()
+        response.read()
+        latency.observe(time.perf_counter() - start)
+        if response.status != 200:
+            errors += 1
+        i += 1
+    conn.close()
+    return latency.counts, latency.count, errors
+
+
+def wait_for(url=None, unix_socket=None, timeout=30.0):
+    """
+    Returns the service's /health once it answers
+    """
+    deadline = time.time() + timeout
+    while True:
+        try:
+            conn = connect(url, unix_socket)
+            conn.request('GET', '/health')
+            health = json.loads(conn.getresponse().read())
+            conn.close()
+            return health
+        except (OSError, http.client.HTTPException):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run(url, unix_socket, paths, clients, seconds):
+    with ProcessPoolExecutor(clients) as pool:
+        results = list(pool.map(client, [(url, unix_socket, paths, seconds)] * clients))
+    latency = Histogram(LATENCY_BUCKETS)
+    errors = 0
+    for counts, count, failed in results:
+        latency.counts = [a + b for a, b in zip(latency.counts, counts)]
+        latency.count += count
+        errors += failed
+    return {
+        'requests': latency.count,
+        'errors': errors,
+        'requests_per_second': latency.count / seconds,
+        'p50_ms': latency.quantile(0.5) * 1000,
+        'p99_ms': latency.quantile(0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", type=str, help="service to load, e.g. http://127.0.0.1:8080")
+    parser.add_argument("--socket", type=str, help="Unix socket of the service to load")
+    parser.add_argument("-d", "--database", type=str, default=fixtures.SNAPSHOT,
+                        help="database to serve when starting a service, copied first")
+    parser.add_argument("-c", "--clients", type=int, default=os.cpu_count(), help="client processes")
+    parser.add_argument("-t", "--seconds", type=float, default=10.0, help="seconds each client runs")
+    parser.add_argument("-a", "--author", type=str, help="ask for random poems by this author")
+    parser.add_argument("--max_lines", type=int, help="ask for random poems of at most this many lines")
+    parser.add_argument("--by_id", action="store_true", help="also request poems by id, round robin")
+
+    args = parser.parse_args()
+    query = '&'.join(f'{name}={value}' for name, value in [('author', args.author), ('max_lines', args.max_lines)]
+                     if value is not None)
+    paths = ['/poem/random' + ('?' + query if query else '')]
+
+    service = None
+    tmp = None
+    url = args.url
+    if not url and not args.socket:
+        tmp = tempfile.mkdtemp()
+        database = os.path.join(tmp, 'poems.db')
+        shutil.copyfile(args.database, database)
+        # the service reads only, the copy is brought up to the current schema here
+        conn = sqlite3.connect(database, isolation_level=None)
+        sql_util.migrate(conn.cursor())
+        sql_util.fill_poem_stats(conn.cursor())
+        conn.close()
+        url = f'http://127.0.0.1:{free_port()}'
+        service = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py'), '-d', database,
+                                    '--port', str(urlsplit(url).port), '--log_level', 'WARNING'])
+    try:
+        health = wait_for(url, args.socket)
+        print(f"⚙ {health['poems']} poems served, {args.clients} clients for {args.seconds:g}s")
+        if args.by_id:
+            conn = connect(url, args.socket)
+            for _ in range(64):
+                conn.request('GET', paths[0])
+                paths.append(f"/poem/{json.loads(conn.getresponse().read())['id']}")
+            conn.close()
+        result = run(url, args.socket, paths, args.clients, args.seconds)
+    finally:
+        if service:
+            service.terminate()
+            service.wait()
+        if tmp:
+            shutil.rmtree(tmp)
+    print('  '.join(f'{name} {value:.4g}' for name, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
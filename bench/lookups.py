@@ -0,0 +1,74 @@
+"""
+Times the scrapers' and readers' point lookups on a copy of a snapshot before
+and after sql_util.migrate adds the secondary indexes
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql_util  # noqa: E402
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "db_snapshots", "05-18-full-SNAP.db")
+
+LOOKUPS = [
+    ("poet by name", """SELECT * FROM POETS WHERE poet_name = ?;""",
+     "SELECT poet_name FROM POETS ORDER BY pid"),
+    ("poem by name and poet", """SELECT * FROM POEMS WHERE poem_name = ? AND poet_id = ?;""",
+     "SELECT poem_name, poet_id FROM POEMS ORDER BY pid"),
+    ("poem by url", """SELECT pid FROM POEMS WHERE url = ?;""",
+     "SELECT url FROM POEMS WHERE url IS NOT NULL ORDER BY pid"),
+    ("tag by name", """SELECT * FROM TAGS WHERE name = ?;""",
+     "SELECT DISTINCT name FROM TAGS"),
+    ("lines by poem", """SELECT poem_line FROM LINES WHERE pid = ? ORDER BY lid;""",
+     "SELECT pid FROM POEMS ORDER BY pid"),
+]
+
+
+def time_lookups(cursor, samples):
+    """
+    Returns the mean latency in microseconds of each lookup over up to samples keys
+    """
+    results = {}
+    for name, query, keys_query in LOOKUPS:
+        keys = [tuple(row) for row in cursor.execute(keys_query).fetchall()[:samples]]
+        start = time.perf_counter()
+        for key in keys:
+            cursor.execute(query, key).fetchall()
+        results[name] = (time.perf_counter() - start) / max(1, len(keys)) * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=SNAPSHOT, help="database to copy and benchmark")
+    parser.add_argument("-n", "--samples", type=int, default=500, help="keys looked up per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        shutil.copyfile(args.database, path)
+        conn = sqlite3.connect(path, isolation_level=None)
+        cursor = conn.cursor()
+        before_version = sql_util.schema_version(cursor)
+        before = time_lookups(cursor, args.samples)
+        sql_util.migrate(cursor)
+        after = time_lookups(cursor, args.samples)
+        conn.close()
+
+    print(f"{'lookup':<24}{'schema ' + str(before_version):>12}{'migrated':>12}{'speedup':>10}")
+    for name, _, _ in LOOKUPS:
+        print(f"{name:<24}{before[name]:>10.1f}us{after[name]:>10.1f}us{before[name] / after[name]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Parser regression check. Every poem page of the fixture pages is parsed with each
+of scrape.PARSERS and the run fails if the Poems found differ in title, author,
+lines, translator, source or year. Poet and collection pages are compared by the
+poem links found on them, which decide what poems a run queues and tags
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures  # noqa: E402
+import logs  # noqa: E402
+import pipeline  # noqa: E402
+import scrape  # noqa: E402
+
+FIELDS = ('title', 'lines', 'translator', 'source', 'year')
+
+
+def pages(directory):
+    """
+    Yields (path, body) of every page under directory
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                yield '/' + os.path.relpath(path, directory).replace(os.sep, '/'), f.read()
+
+
+def parse(path, body, parser):
+    """
+    Returns what a scrape takes from the page at path with parser: the poem fields
+    and author of a poem page, or the poem links of any other page
+    """
+    url = fixtures.POETRY_URL + path
+    if path.startswith('/poems/'):
+        poem, author = pipeline.parse_page(url, body, parser)
+        if poem is None:
+            return None
+        return tuple(getattr(poem, field) for field in FIELDS) + (author,)
+    scrape.set_parser(parser)
+    return [link.get('href') for link in scrape.find_poem_links(scrape.soup_from(body))]
+
+
+def check(directory, parsers):
+    """
+    Returns (pages compared, paths whose result differs between parsers)
+    """
+    count = 0
+    differ = []
+    for path, body in pages(directory):
+        results = [parse(path, body, parser) for parser in parsers]
+        if any(result != results[0] for result in results[1:]):
+            differ.append(path)
+        count += 1
+    return count, differ
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=fixtures.SNAPSHOT, help="poems database to render")
+    parser.add_argument("--pages", type=str, help="check saved pages from this directory instead of rendering")
+    parser.add_argument("--poets", type=int, default=5, help="poets rendered")
+
+    args = parser.parse_args()
+    # find_poem logs every title it parses
+    logs.configure('WARNING')
+    tmp = None
+    directory = args.pages
+    if not directory:
+        tmp = directory = tempfile.mkdtemp()
+        fixtures.render_poets(args.database, directory, args.poets)
+    try:
+        count, differ = check(directory, scrape.PARSERS)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+    for path in differ:
+        print(f"✗ {path}")
+    if differ:
+        sys.exit(f"{len(differ)} of {count} pages parse differently under {', '.join(scrape.PARSERS)}")
+    print(f"✓ {count} pages parse the same under {', '.join(scrape.PARSERS)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Measures the memory each loaded Poem and Song takes, comparing the slotted records
+with the dict-backed layout they replaced, which kept both the lines and a joined
+copy of the text
+"""
+
+from __future__ import print_function
+
+import argparse
+import gc
+import os
+import sqlite3
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export  # noqa: E402
+import poem  # noqa: E402
+from songs import Song  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SNAPSHOT = os.path.join(ROOT, "db_snapshots", "05-18-full-SNAP.db")
+SONGS = os.path.join(ROOT, "songs.db")
+
+
+class DictRecord(object):
+    """
+    The previous record layout: an instance dict holding the lines and the text
+    """
+
+    def __init__(self, title, author, text, id):
+        self.title = title
+        self.author = author
+        self.lines = text.split('\n') if text else []
+        self.text = '\n'.join(self.lines)
+        self.url = self.year = self.translator = self.source = None
+        self.id = id
+
+
+def measure(build, database, statement):
+    """
+    Returns (records, bytes retained per record) when build makes a record from
+    each row of statement. Rows are dropped as they are read, so only what the
+    records keep alive is counted
+    """
+    conn = sqlite3.connect(database)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [build(row) for row in conn.execute(statement)]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    conn.close()
+    return len(records), (after - before) / max(1, len(records))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=SNAPSHOT, help="poems database to load")
+    parser.add_argument("-s", "--songs", type=str, default=SONGS, help="songs database to load")
+    args = parser.parse_args()
+
+    cases = [
+        ("poems", "dict with lines + text", lambda r: DictRecord(r[1], r[2], r[6], r[0])),
+        ("poems", "slotted", export.poem_from),
+        ("poems", "slotted + interned authors", export.poem_from),
+    ]
+    if os.path.exists(args.songs):
+        cases += [
+            ("songs", "dict with lines + lyrics", lambda r: DictRecord(r[0], r[1], r[2], None)),
+            ("songs", "slotted", lambda r: Song(r[1], r[0], r[2])),
+            ("songs", "slotted + interned artists", lambda r: Song(r[1], r[0], r[2])),
+        ]
+    statements = {"poems": (args.database, export.SELECT_ALL),
+                  "songs": (args.songs, "SELECT name, artist, lyrics FROM songs;")}
+
+    print(f"{'records':<40}{'count':>8}{'B/record':>12}{'vs dict':>10}")
+    baseline = {}
+    for kind, name, build in cases:
+        poem.set_intern_authors('interned' in name)
+        count, size = measure(build, *statements[kind])
+        baseline.setdefault(kind, size)
+        print(f"{kind + ', ' + name:<40}{count:>8}{size:>12.0f}{baseline[kind] / size:>9.2f}x")
+    poem.set_intern_authors(False)
+
+
+if __name__ == '__main__':
+    main()
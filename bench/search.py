@@ -0,0 +1,77 @@
+"""
+Times full text queries against a LIKE scan over LINES on a copy of a snapshot
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import search  # noqa: E402
+import sql_util  # noqa: E402
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "db_snapshots", "05-18-full-SNAP.db")
+
+SCAN_LINES = """SELECT DISTINCT pid FROM LINES WHERE poem_line LIKE ? LIMIT ?;"""
+
+
+def sample_words(cursor, count, seed):
+    """
+    Returns count words of at least five letters drawn from the corpus lines
+    """
+    words = set()
+    for (line,) in cursor.execute("SELECT poem_line FROM LINES;"):
+        words.update(w.lower() for w in re.findall(r'[A-Za-z]{5,}', line or ''))
+    return random.Random(seed).sample(sorted(words), min(count, len(words)))
+
+
+def mean_ms(run, queries):
+    start = time.perf_counter()
+    for query in queries:
+        run(query)
+    return (time.perf_counter() - start) / max(1, len(queries)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=SNAPSHOT, help="poems database to copy and benchmark")
+    parser.add_argument("-n", "--queries", type=int, default=200, help="number of queries")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the sampled query words")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        shutil.copyfile(args.database, path)
+        conn = sqlite3.connect(path, isolation_level=None)
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        sql_util.migrate(cursor)
+        build = time.perf_counter() - start
+        words = sample_words(cursor, args.queries, args.seed)
+        pairs = [f'{a} {b}' for a, b in zip(words, reversed(words))]
+
+        scan = mean_ms(lambda w: cursor.execute(SCAN_LINES, (f'%{w}%', search.LIMIT)).fetchall(), words)
+        word = mean_ms(lambda w: search.search_poems(cursor, w), words)
+        both = mean_ms(lambda q: search.search_poems(cursor, q), pairs)
+        prefix = mean_ms(lambda w: search.search_poems(cursor, w[:4] + '*'), words)
+        conn.close()
+
+    print(f"migrate + index build  {build * 1000:>8.1f}ms")
+    print(f"LIKE scan over LINES   {scan:>8.2f}ms/query")
+    print(f"fts single word        {word:>8.2f}ms/query")
+    print(f"fts two words          {both:>8.2f}ms/query")
+    print(f"fts prefix             {prefix:>8.2f}ms/query")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Times the scrape, store, export and read hot paths end to end against pages
+replayed by a local fixture server, plus micro-benchmarks of the parsing and
+insert helpers. Results are written as JSON, and --compare prints the change
+against an earlier results file so regressions show up between commits
+"""
+
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import export  # noqa: E402
+import fixtures  # noqa: E402
+import read  # noqa: E402
+import scrape  # noqa: E402
+import songs  # noqa: E402
+import sql_util  # noqa: E402
+import store  # noqa: E402
+from azlyrics import ARTISTS, create_tables as create_song_tables, scrape_albums  # noqa: E402
+from fixtures import connect, fresh_session, quiet  # noqa: E402
+from poem import Poem  # noqa: E402
+
+RESULTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def best_of(run, repeat):
+    """
+    Returns the fastest of repeat runs in seconds
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def per_op(run, number, repeat):
+    """
+    Returns the best microseconds per call of run over repeat batches of number calls
+    """
+    def batch():
+        for _ in range(number):
+            run()
+    return best_of(batch, repeat) / number * 1e6
+
+
+def bench_add_poet_poems(tmp, base_url, poets, repeat):
+    scrape.POET_URL = base_url + "/poets/%s#about"
+
+    def run():
+        path = os.path.join(tmp, f"scrape-{time.perf_counter_ns()}.db")
+        conn, cursor = fixtures.scrape_database(path)
+        with quiet():
+            fresh_session()
+            for poet in poets:
+                scrape.add_poet_poems(poet, cursor)
+            sql_util.commit(cursor)
+        run.poems = cursor.execute("SELECT count(*) FROM POEMS;").fetchone()[0]
+        conn.close()
+    seconds = best_of(run, repeat)
+    return {"seconds": seconds, "poems": run.poems, "poems_per_second": run.poems / seconds}
+
+
+def bench_scrape_albums(tmp, base_url, artist, repeat):
+    songs.MakeRequest.baseURL = base_url + "/"
+
+    def run():
+        path = os.path.join(tmp, f"songs-{time.perf_counter_ns()}.db")
+        conn, cursor = connect(path)
+        with quiet():
+            create_song_tables(cursor)
+            fresh_session()
+            scrape_albums(songs.Artist(artist.artist_name, artist.song_page_name), cursor)
+            sql_util.commit(cursor)
+        run.songs = cursor.execute("SELECT count(*) FROM songs;").fetchone()[0]
+        conn.close()
+    seconds = best_of(run, repeat)
+    return {"seconds": seconds, "songs": run.songs, "songs_per_second": run.songs / seconds}
+
+
+def bench_export(tmp, database, repeat):
+    export.DATABASE = database
+    out = os.path.join(tmp, "export.txt")
+
+    def run():
+        with quiet():
+            run.poems = export.write_poems(out, export.get_poems(), shuffle=True)
+    seconds = best_of(run, repeat)
+    return {"seconds": seconds, "poems": run.poems, "bytes": os.path.getsize(out)}
+
+
+def bench_random_poem(database, number, repeat):
+    read.DATABASE = database
+    with quiet():
+        read.get_random_poem()
+        return {"us_per_op": per_op(read.get_random_poem, number, repeat)}
+
+
+def micro_benchmarks(fixture_dir, number, repeat):
+    poem_dir = os.path.join(fixture_dir, "poems")
+    first = os.path.join(poem_dir, sorted(os.listdir(poem_dir))[0])
+    with open(os.path.join(first, os.listdir(first)[0]), 'rb') as f:
+        soup = scrape.soup_from(f.read())
+    lines = scrape.find_poem_lines(soup)
+    raw = [line + '&nbsp;&amp; \xa0 ' for line in lines]
+
+    conn = sqlite3.connect(":memory:", isolation_level=None)
+    cursor = conn.cursor()
+    with quiet():
+        store.create_tables(cursor)
+    poet_id = store.create_poet("Bench Poet", None, cursor)
+    poem = Poem(title="Bench", lines=lines, url="http://localhost/poems/1/bench", source="Source (1999)",
+                year="(1999)")
+    titles = itertools.count()
+
+    def create_poem():
+        # POEMS is unique by (poem_name, poet_id)
+        poem.title = f"Bench {next(titles)}"
+        store.create_poem(poem, poet_id, cursor)
+
+    cursor.execute("BEGIN;")
+    results = {
+        "find_poem_lines": {"us_per_op": per_op(lambda: scrape.find_poem_lines(soup), number, repeat),
+                            "lines": len(lines)},
+        "unescape_text": {"us_per_op": per_op(lambda: [scrape.unescape_text(line, left=True) for line in raw],
+                                              number, repeat) / max(1, len(raw))},
+        "create_poem": {"us_per_op": per_op(create_poem, number * 10, repeat)},
+    }
+    cursor.execute("ROLLBACK;")
+    conn.close()
+    return results
+
+
+def commit_id():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    """
+    Prints each timing next to the same timing in an earlier results file
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n{'vs ' + baseline['commit']:<24}{'before':>12}{'after':>12}{'change':>10}")
+    for name, metrics in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name, {})
+        for unit in ("seconds", "us_per_op"):
+            if unit in metrics and unit in before:
+                change = (metrics[unit] - before[unit]) / before[unit] * 100
+                print(f"{name:<24}{before[unit]:>12.4g}{metrics[unit]:>12.4g}{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=fixtures.SNAPSHOT, help="poems database to replay")
+    parser.add_argument("-s", "--songs", type=str, default=fixtures.SONGS, help="songs database to replay")
+    parser.add_argument("--pages", type=str, help="replay saved pages from this directory instead of rendering")
+    parser.add_argument("--poets", type=int, default=5, help="poets rendered and scraped")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per end to end benchmark, best kept")
+    parser.add_argument("-n", "--number", type=int, default=200, help="calls per micro-benchmark batch")
+    parser.add_argument("-o", "--out", type=str, help="results file, bench/results/<commit>.json by default")
+    parser.add_argument("--compare", type=str, help="earlier results file to compare against")
+
+    args = parser.parse_args()
+    results = {
+        "commit": commit_id(),
+        "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "parser": scrape.PARSER,
+        "benchmarks": {},
+    }
+    benchmarks = results["benchmarks"]
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_dir = args.pages or os.path.join(tmp, "pages")
+        database = os.path.join(tmp, "poems.db")
+        shutil.copyfile(args.database, database)
+        with quiet():
+            conn, cursor = connect(database)
+            sql_util.migrate(cursor)
+            sql_util.fill_poem_stats(cursor)
+            conn.close()
+
+        artist = ARTISTS[0]
+        if args.pages:
+            poets = fixtures.saved_poets(fixture_dir)[:args.poets]
+        else:
+            poets = fixtures.render_poets(database, fixture_dir, args.poets)
+            if os.path.exists(args.songs):
+                fixtures.render_artist(args.songs, fixture_dir, artist)
+        index = os.path.join(fixture_dir, urlsplit(artist.get_song_list_url()).path.lstrip('/'))
+
+        with fixtures.FixtureServer(fixture_dir) as server:
+            print(f"⚙ add_poet_poems over {len(poets)} poets")
+            benchmarks["add_poet_poems"] = bench_add_poet_poems(tmp, server.url, poets, args.repeat)
+            if os.path.exists(index):
+                print(f"⚙ scrape_albums for {artist.artist_name}")
+                benchmarks["scrape_albums"] = bench_scrape_albums(tmp, server.url, artist, args.repeat)
+
+        print("⚙ export")
+        benchmarks["export"] = bench_export(tmp, database, args.repeat)
+        print("⚙ get_random_poem")
+        benchmarks["get_random_poem"] = bench_random_poem(database, args.number, args.repeat)
+        print("⚙ micro-benchmarks")
+        benchmarks.update(micro_benchmarks(fixture_dir, args.number, args.repeat))
+
+    for name, metrics in benchmarks.items():
+        print(f"{name:<24}" + "  ".join(f"{key} {value:.4g}" for key, value in metrics.items()))
+
+    out = args.out or os.path.join(RESULTS, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"✍︎ wrote {out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Near-duplicate detection for poems and songs. Each text gets a MinHash signature
+over its word shingles, and the signature is split into LSH bands stored in
+FINGERPRINT_BANDS, so only texts sharing a band bucket are compared. A text whose
+estimated similarity to an earlier one reaches the threshold is flagged as its
+duplicate, the text itself is kept
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import random
+import re
+import sqlite3
+import zlib
+from array import array
+
+from sql_util import (CREATE_FINGERPRINT_BANDS, CREATE_FINGERPRINT_BUCKETS, CREATE_FINGERPRINTS, DATABASE,
+                      migrate)
+
+SONGS_DATABASE = "songs.db"
+
+# 16 bands of 4 rows: texts 80% alike share a bucket with probability > 0.999,
+# texts 30% alike only about 12% of the time
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+THRESHOLD = 0.8
+
+PRIME = (1 << 61) - 1
+_rng = random.Random(1)
+PERMUTATIONS = [(_rng.randrange(1, PRIME), _rng.randrange(0, PRIME)) for _ in range(NUM_PERM)]
+
+WORD = re.compile(r"\w+")
+
+SELECT_UNFINGERPRINTED = {
+    'poems': """SELECT rowid, text FROM POEMS_FTS
+                WHERE rowid NOT IN (SELECT id FROM FINGERPRINTS) ORDER BY rowid;""",
+    'songs': """SELECT id, lyrics FROM songs
+                WHERE id NOT IN (SELECT id FROM FINGERPRINTS) ORDER BY id;""",
+}
+SELECT_BUCKET = """SELECT id FROM FINGERPRINT_BANDS WHERE band = ? AND bucket = ?;"""
+SELECT_FINGERPRINT = """SELECT signature, duplicate_of FROM FINGERPRINTS WHERE id = ?;"""
+INSERT_FINGERPRINT = """INSERT OR REPLACE INTO FINGERPRINTS (id, signature, duplicate_of) VALUES (?, ?, ?);"""
+INSERT_BAND = """INSERT INTO FINGERPRINT_BANDS (band, bucket, id) VALUES (?, ?, ?);"""
+
+
+def create_tables(cursor):
+    """
+    Sets up the fingerprint tables on a database that isn't managed by MIGRATIONS
+    """
+    cursor.execute(CREATE_FINGERPRINTS)
+    cursor.execute(CREATE_FINGERPRINT_BANDS)
+    cursor.execute(CREATE_FINGERPRINT_BUCKETS)
+
+
+def shingles(text):
+    """
+    Returns the hashes of the overlapping SHINGLE word runs of text, lower cased
+    so punctuation, case and line breaks don't matter
+    """
+    words = WORD.findall((text or '').lower())
+    if len(words) <= SHINGLE:
+        return {zlib.crc32(' '.join(words).encode('utf-8'))} if words else set()
+    return {zlib.crc32(' '.join(words[i:i + SHINGLE]).encode('utf-8')) for i in range(len(words) - SHINGLE + 1)}
+
+
+def signature(text):
+    """
+    Returns the MinHash signature of text as an array of NUM_PERM values, or None
+    when text has no words
+    """
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return array('Q', [min((a * x + b) % PRIME for x in hashes) for a, b in PERMUTATIONS])
+
+
+def similarity(first, second):
+    """
+    Estimates the Jaccard similarity of the shingles behind two signatures
+    """
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def buckets(sig):
+    """
+    Returns the (band, bucket) pairs of a signature
+    """
+    return [(band, int.from_bytes(hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8)
+                                  .digest(), 'little', signed=True))
+            for band in range(BANDS)]
+
+
+def fingerprint(cursor, id, text, threshold=THRESHOLD):
+    """
+    Stores the fingerprint of the text with id and returns the id of the earliest
+    near-duplicate already fingerprinted, or None
+    """
+    sig = signature(text)
+    if sig is None:
+        cursor.execute(INSERT_FINGERPRINT, (id, None, None))
+        return None
+    pairs = buckets(sig)
+    candidates = set()
+    for pair in pairs:
+        candidates.update(row[0] for row in cursor.execute(SELECT_BUCKET, pair))
+    candidates.discard(id)
+
+    duplicate_of = None
+    for candidate in sorted(candidates):
+        other, other_of = cursor.execute(SELECT_FINGERPRINT, (candidate,)).fetchone()
+        if similarity(sig, array('Q', other)) >= threshold:
+            original = other_of or candidate
+            if duplicate_of is None or original < duplicate_of:
+                duplicate_of = original
+    cursor.execute(INSERT_FINGERPRINT, (id, sig.tobytes(), duplicate_of))
+    cursor.executemany(INSERT_BAND, [(band, bucket, id) for band, bucket in pairs])
+    return duplicate_of
+
+
+def fingerprint_missing(cursor, kind='poems', threshold=THRESHOLD):
+    """
+    Fingerprints every poem or song without one, in id order so the earliest copy
+    stays the original. Returns (fingerprinted, duplicates found)
+    """
+    rows = cursor.execute(SELECT_UNFINGERPRINTED[kind]).fetchall()
+    found = 0
+    began = not cursor.connection.in_transaction
+    if began:
+        cursor.execute("BEGIN;")
+    for id, text in rows:
+        if fingerprint(cursor, id, text, threshold) is not None:
+            found += 1
+    if began:
+        cursor.execute("COMMIT;")
+    return len(rows), found
+
+
+def rebuild(cursor):
+    """
+    Clears every fingerprint so the next pass starts over, e.g. with a new threshold
+    """
+    cursor.execute("DELETE FROM FINGERPRINT_BANDS;")
+    cursor.execute("DELETE FROM FINGERPRINTS;")
+
+
+def dedup_database(database, kind='poems', threshold=THRESHOLD, fresh=False):
+    """
+    Brings the fingerprints of database up to date. Returns (fingerprinted, duplicates found)
+    """
+    conn = sqlite3.connect(database, isolation_level=None)
+    cursor = conn.cursor()
+    if kind == 'songs':
+        import azlyrics
+        azlyrics.create_tables(cursor)
+    else:
+        migrate(cursor)
+    if fresh:
+        rebuild(cursor)
+    counts = fingerprint_missing(cursor, kind, threshold)
+    cursor.close()
+    conn.close()
+    return counts
+
+
+def duplicates(cursor):
+    """
+    Returns (id, duplicate_of) for every flagged near-duplicate
+    """
+    return cursor.execute("""SELECT id, duplicate_of FROM FINGERPRINTS
+                             WHERE duplicate_of IS NOT NULL ORDER BY id;""").fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, help="database to dedup")
+    parser.add_argument("--songs", action="store_true", help="database is a songs.db")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="estimated similarity that counts")
+    parser.add_argument("--rebuild", action="store_true", help="fingerprint everything again")
+    parser.add_argument("--list", action="store_true", help="print every near-duplicate")
+
+    args = parser.parse_args()
+    kind = 'songs' if args.songs else 'poems'
+    database = args.database or (SONGS_DATABASE if args.songs else DATABASE)
+    fingerprinted, found = dedup_database(database, kind, args.threshold, args.rebuild)
+    print(f'≈ {found} near-duplicates among {fingerprinted} new {kind}')
+    if args.list:
+        conn = sqlite3.connect(database)
+        for id, duplicate_of in duplicates(conn.cursor()):
+            print(f'{id:>6} ≈ {duplicate_of}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,9 @@ import os
 import random
 import sqlite3
 import argparse
-from sql_util import DATABASE
+from sql_util import DATABASE, tag_names
 from poem import Poem
+import manifest
 
 SELECT_POEMS_BASE = """
 SELECT PM.pid,
@@ -25,6 +26,33 @@ GRP_PID = """\nGROUP BY PM.pid"""
 
 SELECT_ALL = SELECT_POEMS_BASE + GRP_PID + ";"
 
+SELECT_POEM_IDS_BASE = """
+SELECT PM.pid
+FROM POEMS AS PM
+         JOIN POETS AS PT ON PT.PID = PM.poet_id
+WHERE PM.pid > 0
+"""
+
+# filter values are bound into temp tables so the statement text, and with it the
+# cached prepared statement, stays the same however many values are given
+CREATE_FILTERS = [
+    """CREATE TEMP TABLE IF NOT EXISTS FILTER_AUTHORS (name VARCHAR(124) PRIMARY KEY);""",
+    """CREATE TEMP TABLE IF NOT EXISTS FILTER_TAGS (name VARCHAR(256) PRIMARY KEY);""",
+    """CREATE TEMP TABLE IF NOT EXISTS FILTER_PIDS (pid INTEGER PRIMARY KEY);""",
+]
+FILTER_AUTHORS = """\nAND PT.poet_name IN (SELECT name FROM temp.FILTER_AUTHORS)"""
+FILTER_TAGS = """\nAND EXISTS (SELECT 1 FROM TAGS AS T
+            WHERE T.pid = PM.pid AND T.name IN (SELECT name FROM temp.FILTER_TAGS))"""
+FILTER_PIDS = """\nAND PM.pid IN (SELECT pid FROM temp.FILTER_PIDS)"""
+FILTER_UNIQUE = """\nAND PM.pid NOT IN (SELECT id FROM FINGERPRINTS WHERE duplicate_of IS NOT NULL)"""
+PID_RANGE = """\nAND PM.pid > ? AND PM.pid <= ?"""
+
+SELECT_LATEST_PID = """SELECT coalesce(max(pid), 0) FROM POEMS;"""
+
+# poems read back per query when exporting in shuffled order
+CHUNK_SIZE = 500
+BUFFER_SIZE = 1024 * 1024
+
 
 def main():
     """
@@ -35,77 +63,262 @@ def main():
     parser.add_argument("-t", "--tag", type=str, help="tags to search over, comma-separated")
     parser.add_argument("-a", "--author", type=str, help="authors to search over, comma-separated")
     parser.add_argument("-o", "--out", type=str, help="output name", default="out/output.txt")
-    parser.add_argument("--only_pid", type=str, help="only pid")
+    parser.add_argument("--only_pid", type=pid_csv, help="only these pids, comma-separated")
+    parser.add_argument("--no_shuffle", action="store_true", help="write poems in pid order")
+    parser.add_argument("--seed", type=int, help="seed for the shuffled order")
+    parser.add_argument("-i", "--incremental", action="store_true",
+                        help="append only poems added since the last export to out")
+    parser.add_argument("--no_duplicates", action="store_true", help="leave near-duplicate poems out")
+    parser.add_argument("--shards", type=int, default=1, help="split the export into this many shard files")
+    parser.add_argument("--procs", type=int, default=os.cpu_count(), help="processes writing shards")
 
     args = parser.parse_args()
+    shuffle = not args.no_shuffle
     if args.all:
-        poems = get_poems()
+        filters = {}
     else:
-        poems = get_poems(args.author, args.tag, args.only_pid)
+        filters = {k: v for k, v in [('author', args.author), ('tag', args.tag), ('only_pid', args.only_pid)] if v}
+    if args.no_duplicates:
+        filters['unique'] = True
+        import dedup
+        dedup.dedup_database(DATABASE)
+    if args.shards > 1:
+        if args.incremental:
+            parser.error("--incremental writes a single file, it can't be combined with --shards")
+        export_shards(args.out, args.shards, filters, shuffle=shuffle, seed=args.seed, procs=args.procs)
+    else:
+        export_poems(args.out, filters, incremental=args.incremental, shuffle=shuffle, seed=args.seed)
+
+
+def export_poems(out, filters=None, incremental=False, shuffle=True, seed=None):
+    """
+    Writes the poems matching filters (author, tag, only_pid csvs) to out and records
+    the highest pid written in its manifest. When incremental and the manifest still
+    matches out, only poems with a higher pid are appended. Returns the count written
+    """
+    filters = filters or {}
+    conn = sqlite3.connect(DATABASE)
+    latest = conn.execute(SELECT_LATEST_PID).fetchone()[0]
+    conn.close()
+
+    previous = manifest.load(out, DATABASE, filters) if incremental else None
+    after = previous['last_id'] if previous else 0
+    if previous and after >= latest:
+        print(f'✓ {out} is up to date [{previous["count"]} poems]')
+        return 0
+
+    poems = iter_poems(filters.get('author'), filters.get('tag'), filters.get('only_pid'), shuffle=shuffle,
+                       seed=seed, after_pid=after, upto_pid=latest, unique=filters.get('unique', False))
+    count = write_poems(out, poems, shuffle=False, append=bool(previous))
+    manifest.save(out, DATABASE, latest, count + (previous['count'] if previous else 0), filters)
+    return count
+
+
+def export_shards(out, shards, filters=None, shuffle=True, seed=None, procs=None):
+    """
+    Splits the poems matching filters round-robin over shards files named after
+    out, shuffled by seed first, and writes them in parallel processes. Each shard
+    gets a sidecar index with the byte offset, byte length, character count and pid
+    of every entry. Returns the shard paths
+    """
+    filters = filters or {}
+    conn = sqlite3.connect(DATABASE)
+    pids = poem_ids(conn.cursor(), filters.get('author'), filters.get('tag'), filters.get('only_pid'),
+                    unique=filters.get('unique', False))
+    conn.close()
+    if shuffle:
+        random.Random(seed).shuffle(pids)
+
+    # multiprocessing is only loaded for sharded exports, single file runs start without it
+    from concurrent.futures import ProcessPoolExecutor
+    tasks = [(DATABASE, shard_path(out, i, shards), pids[i::shards]) for i in range(shards)]
+    with ProcessPoolExecutor(max_workers=max(1, min(procs or 1, shards))) as pool:
+        written = list(pool.map(write_shard, tasks))
+    for path, count, size in written:
+        print(f'wrote {count} poems to {path} [{size / 1024 / 1024:.1f}MB]')
+    return [path for path, _, _ in written]
+
+
+def shard_path(out, index, shards):
+    base, ext = os.path.splitext(out)
+    return f'{base}-{index:05d}-of-{shards:05d}{ext}'
+
+
+def index_path(shard):
+    return os.path.splitext(shard)[0] + '.idx'
+
+
+def write_shard(task):
+    """
+    Writes the poems with the given pids, in that order, to one shard and its index.
+    Runs in a worker process with its own connection
+    """
+    database, path, pids = task
+    conn = sqlite3.connect(database)
+    offset = count = 0
+    with open(path, 'wb', buffering=BUFFER_SIZE) as shard, open(index_path(path), 'w') as index:
+        index.write('offset\tbytes\tchars\tpid\n')
+        for poem in poems_by_ids(conn.cursor(), pids):
+            entry = text_entry_for(poem)
+            data = entry.encode('utf-8')
+            if count:
+                shard.write(b'\n')
+                offset += 1
+            shard.write(data)
+            index.write(f'{offset}\t{len(data)}\t{len(entry)}\t{poem.id}\n')
+            offset += len(data)
+            count += 1
+    conn.close()
+    return path, count, offset
 
-    write_poems(args.out, poems)
-    conn = sqlite3.connect(DATABASE, isolation_level=None)  # auto commit
-    cursor = conn.cursor()
-    cursor.close()
 
+def poem_from(row):
+    poem_id, title, author_str, translator, source, url, text = row
+    return Poem(id=poem_id, title=title, author=author_str, text=text, translator=translator, source=source,
+                url=url)
 
-def poems_from(result):
-    results = result.fetchall()
 
-    if not results:
+def get_poems(author_str=None, tag_str=None, only_pids=None):
+    poems = list(iter_poems(author_str, tag_str, only_pids))
+    if not poems:
         print("query for poem failed")
         return None
-    poems = []
-    for result in results:
-        poem_id, title, author_str, translator, source, url, text = result
-        poem = Poem(id=poem_id, title=title, author=author_str, text=text, translator=translator, source=source,
-                    url=url)
-        poems.append(poem)
-
     print(f'{len(poems)} poems')
     return poems
 
 
-def get_poems(author_str=None, tag_str=None, only_pids=None):
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+def _csv(values):
+    """
+    Returns the non empty comma separated values of a string, or values itself if
+    it is already a list
+    """
+    if isinstance(values, str):
+        values = values.split(',')
+    return [str(x).strip() for x in values if str(x).strip()]
+
 
-    statement = SELECT_POEMS_BASE
+def pid_csv(text):
+    """
+    argparse type for comma separated pids, returns them as a normalized csv string
+    """
+    try:
+        return ','.join(str(int(pid)) for pid in _csv(text))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected comma-separated pids, got '{text}'")
 
+
+def _filters(cursor, author_str=None, tag_str=None, only_pids=None, unique=False):
+    """
+    Loads the filter values into temp tables on cursor and returns the WHERE clauses
+    selecting them. Each filter may be a csv string or a list of any length. unique
+    leaves out poems flagged as near-duplicates by dedup.py
+    """
+    for statement in CREATE_FILTERS:
+        cursor.execute(statement)
+    statement = ""
     if author_str:
-        authors = filter(None, [f'"{x.strip()}"' for x in author_str.split(',')])
-        statement += f"\nAND PT.poet_name IN ({','.join(authors)})"
+        cursor.execute("DELETE FROM temp.FILTER_AUTHORS;")
+        # batch scraped poet names were stored with the newline from poets.txt
+        authors = [(name,) for author in _csv(author_str) for name in (author, author + '\n')]
+        cursor.executemany("INSERT OR IGNORE INTO temp.FILTER_AUTHORS (name) VALUES (?);", authors)
+        statement += FILTER_AUTHORS
     if tag_str:
-        tags = filter(None, [f'"{x.strip()}"' for x in tag_str.split(',')])
-        statement += f"\nAND T.name in ({','.join(tags)})"
+        cursor.execute("DELETE FROM temp.FILTER_TAGS;")
+        tags = [(name,) for name in tag_names(','.join(_csv(tag_str)))]
+        cursor.executemany("INSERT OR IGNORE INTO temp.FILTER_TAGS (name) VALUES (?);", tags)
+        statement += FILTER_TAGS
     if only_pids:
-        pids = filter(None, [f'"{x.strip()}"' for x in only_pids.split(',')])
-        statement += f"\nAND PM.pid in ({','.join(pids)})"
+        cursor.execute("DELETE FROM temp.FILTER_PIDS;")
+        pids = [(int(pid),) for pid in _csv(only_pids)]
+        cursor.executemany("INSERT OR IGNORE INTO temp.FILTER_PIDS (pid) VALUES (?);", pids)
+        statement += FILTER_PIDS
+    if unique:
+        statement += FILTER_UNIQUE
+    return statement
 
-    statement += GRP_PID + ";"
-    # print(f'QUERY: {statement}')
-    result = cursor.execute(statement)
 
-    poems = poems_from(result)
-    cursor.close()
-    conn.commit()
-    return poems
+def iter_poems(author_str=None, tag_str=None, only_pids=None, shuffle=False, seed=None, after_pid=None,
+               upto_pid=None, unique=False):
+    """
+    Yields the poems matching the filters one at a time straight off the cursor,
+    limited to after_pid < pid <= upto_pid when either is given. When shuffle, only
+    the matching pids are shuffled in memory and the poems are read back in chunks
+    of CHUNK_SIZE in that order
+    """
+    conn = sqlite3.connect(DATABASE)
+    cursor = conn.cursor()
+    try:
+        if not shuffle:
+            filters, params = _range_filters(cursor, author_str, tag_str, only_pids, after_pid, upto_pid, unique)
+            for row in cursor.execute(SELECT_POEMS_BASE + filters + GRP_PID + ";", params):
+                yield poem_from(row)
+            return
+
+        pids = poem_ids(cursor, author_str, tag_str, only_pids, after_pid, upto_pid, unique)
+        random.Random(seed).shuffle(pids)
+        yield from poems_by_ids(cursor, pids)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _range_filters(cursor, author_str, tag_str, only_pids, after_pid, upto_pid, unique=False):
+    filters = _filters(cursor, author_str, tag_str, only_pids, unique)
+    params = ()
+    if after_pid is not None or upto_pid is not None:
+        filters += PID_RANGE
+        params = (after_pid or 0, upto_pid if upto_pid is not None else 2 ** 63 - 1)
+    return filters, params
+
+
+def poem_ids(cursor, author_str=None, tag_str=None, only_pids=None, after_pid=None, upto_pid=None, unique=False):
+    """
+    Returns the pids of the poems matching the filters in pid order
+    """
+    filters, params = _range_filters(cursor, author_str, tag_str, only_pids, after_pid, upto_pid, unique)
+    return [row[0] for row in cursor.execute(SELECT_POEM_IDS_BASE + filters + "\nORDER BY PM.pid;", params)]
+
+
+def poems_by_ids(cursor, pids):
+    """
+    Yields the poems with pids in the given order, reading CHUNK_SIZE at a time.
+    Poems without lines are skipped
+    """
+    for start in range(0, len(pids), CHUNK_SIZE):
+        chunk = pids[start:start + CHUNK_SIZE]
+        statement = SELECT_POEMS_BASE + f"\nAND PM.pid IN ({','.join('?' * len(chunk))})" + GRP_PID + ";"
+        by_pid = {row[0]: row for row in cursor.execute(statement, chunk)}
+        for pid in chunk:
+            if pid in by_pid:
+                yield poem_from(by_pid[pid])
 
 
 def text_entry_for(poem):
     return f'<|title|>{poem.title}<|title|>\n\n\n{poem.full_text()}\n\n<|endoftext|>'
 
 
-def write_poems(filename, poems, shuffle=True):
-    if os.path.exists(filename):
+def write_poems(filename, poems, shuffle=True, append=False):
+    """
+    Writes the text entry of each poem to filename as it is produced, or adds them
+    to the end of it when append. poems may be any iterable; shuffle materializes
+    it first, so pass pre-shuffled iterators with shuffle=False to keep memory flat
+    """
+    separate = append and os.path.exists(filename) and os.path.getsize(filename) > 0
+    if not append and os.path.exists(filename):
         os.remove(filename)
         print(f'deleted existing out @ {filename}')
-    f = open(filename, "w")
     if shuffle:
+        poems = list(poems)
         random.shuffle(poems)
-    f.write('\n'.join([text_entry_for(p) for p in poems]))
-    f.close()
-    print(f'wrote to {filename}')
+    count = 0
+    with open(filename, "a" if append else "w", buffering=BUFFER_SIZE) as f:
+        for poem in poems:
+            if count or separate:
+                f.write('\n')
+            f.write(text_entry_for(poem))
+            count += 1
+    print(f'{"appended" if append else "wrote"} {count} poems to {filename}')
+    return count
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+"""
+Bounded-concurrency page fetching shared by the scrapers
+"""
+
+from __future__ import print_function
+
+import collections
+import threading
+import urllib.error
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import http_session
+import logs
+
+USER_AGENT = "Google Chrome"
+
+WORKERS = 8
+PER_HOST = 4
+
+log = logs.get('fetch')
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+
+
+def configure(workers=None, per_host=None):
+    """
+    Sets the default worker count and per-host limit used by fetch_pages
+    """
+    global WORKERS, PER_HOST
+    if workers:
+        WORKERS = max(1, workers)
+    if per_host:
+        PER_HOST = max(1, per_host)
+        with _host_locks_guard:
+            _host_locks.clear()
+
+
+def _host_slot(url):
+    """
+    Returns the semaphore bounding concurrent requests to the host of url
+    """
+    host = urllib.parse.urlsplit(url).netloc
+    with _host_locks_guard:
+        slot = _host_locks.get(host)
+        if slot is None:
+            slot = threading.BoundedSemaphore(PER_HOST)
+            _host_locks[host] = slot
+        return slot
+
+
+def fetch_page(url, headers=None):
+    """
+    Returns the body of url as bytes or None if it could not be fetched
+    """
+    headers = headers or {'User-Agent': USER_AGENT}
+    try:
+        with _host_slot(url):
+            return http_session.get(url, headers).read()
+    except urllib.error.HTTPError as err:
+        log.warning("Page not found, error " + str(err), extra={'url': url, 'status': err.code})
+    except urllib.error.URLError as err:
+        log.warning("Page not found, error " + str(err), extra={'url': url})
+    return None
+
+
+def fetch_pages(urls, workers=None, headers=None):
+    """
+    Fetches urls concurrently with at most workers requests in flight and yields
+    (url, body) pairs in the same order as urls. body is None for failed fetches
+    """
+    workers = workers or WORKERS
+    urls = iter(urls)
+    window = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # keep a bounded window of requests ahead of the consumer so a slow
+        # writer doesn't buffer a whole poet's pages in memory
+        for url in urls:
+            window.append((url, pool.submit(fetch_page, url, headers)))
+            if len(window) >= workers * 2:
+                break
+        while window:
+            url, future = window.popleft()
+            body = future.result()
+            following = next(urls, None)
+            if following is not None:
+                window.append((following, pool.submit(fetch_page, following, headers)))
+            yield url, body
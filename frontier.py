@@ -0,0 +1,292 @@
+"""
+Persistent crawl frontier for batch runs. Every poet, collection and poem url a
+batch run needs goes into FRONTIER with its state, so a restarted run picks up
+exactly where the last one stopped. Finished poet and collection pages are
+queued again by the next run, so poems added to them since are found. Failed pages
+are retried with exponential backoff. Workers claim entries with a lease, so several processes can work the
+same database, optionally split into shards by url hash
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import socket
+import time
+import zlib
+
+from sql_util import commit
+
+PENDING = 'pending'
+FETCHED = 'fetched'
+PARSED = 'parsed'
+WRITTEN = 'written'
+FAILED = 'failed'
+
+MAX_RETRIES = 4
+# seconds before the first retry of a failed page, doubled for every retry after
+BACKOFF = 10.0
+# seconds a claim holds before another worker may take the entry over
+LEASE = 600.0
+# seconds between looks at the frontier while other workers are still expanding pages
+POLL = 5.0
+
+WORKER = f'{socket.gethostname()}:{os.getpid()}'
+
+# an url already in the frontier keeps its state and parent, and gains the tags of
+# every page that links to it, e.g. a poem queued under its poet and then found in a
+# tagged collection
+INSERT_ENTRY = """
+INSERT INTO FRONTIER (url, kind, name, tags, parent, shard, state, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE
+SET tags = CASE
+               WHEN FRONTIER.tags IS NULL OR FRONTIER.tags = '' THEN excluded.tags
+               WHEN instr(',' || FRONTIER.tags || ',', ',' || excluded.tags || ',') > 0 THEN FRONTIER.tags
+               ELSE FRONTIER.tags || ',' || excluded.tags
+           END,
+    updated_at = excluded.updated_at
+WHERE excluded.tags IS NOT NULL AND excluded.tags != '';
+"""
+
+# pending pages, poems parsed but not confirmed written, and failures due a retry,
+# that nobody holds a live claim on
+CLAIMABLE = """
+(F.state IN ('pending', 'parsed') OR (F.state = 'failed' AND F.retries < ? AND F.next_attempt <= ?))
+AND (F.claimed_by IS NULL OR F.claimed_at < ?)
+"""
+
+SELECT_CLAIMABLE = """
+SELECT F.url, F.kind, F.name, F.tags, F.parent, F.retries, P.kind, P.name, P.tags
+FROM FRONTIER AS F
+         LEFT JOIN FRONTIER AS P ON P.url = F.parent
+WHERE F.kind IN ({kinds})
+AND {claimable}
+{filters}
+ORDER BY F.rowid
+LIMIT ?;
+"""
+
+CLAIM = """UPDATE FRONTIER SET claimed_by = ?, claimed_at = ? WHERE url = ?;"""
+
+MARK = """UPDATE FRONTIER SET state = ?, error = NULL, claimed_by = NULL, updated_at = ? WHERE url = ?;"""
+MARK_FAILED = """
+UPDATE FRONTIER
+SET state = 'failed', retries = retries + 1, next_attempt = ? + ? * (1 << retries), error = ?,
+    claimed_by = NULL, updated_at = ?
+WHERE url = ?;
+"""
+
+# poets and collections whose poems are all written or out of retries
+FINISH_PARENTS = """
+UPDATE FRONTIER
+SET state = 'written', updated_at = ?
+WHERE kind IN ('poet', 'collection') AND state = 'fetched'
+AND NOT EXISTS (SELECT 1 FROM FRONTIER AS C
+                WHERE C.parent = FRONTIER.url
+                AND (C.state IN ('pending', 'parsed') OR (C.state = 'failed' AND C.retries < ?)));
+"""
+
+SELECT_NEXT_RETRY = """
+SELECT min(next_attempt) FROM FRONTIER AS F
+WHERE F.kind IN ({kinds}) AND F.state = 'failed' AND F.retries < ?
+{filters};
+"""
+
+# pages another worker is expanding, which may still add poems to any shard
+SELECT_LIVE_CLAIMS = """
+SELECT count(*) FROM FRONTIER
+WHERE kind IN ({kinds}) AND state IN ('pending', 'failed') AND claimed_by IS NOT NULL AND claimed_at >= ?;
+"""
+
+SELECT_STATUS = """SELECT kind, state, count(*), sum(retries) FROM FRONTIER GROUP BY kind, state ORDER BY kind, state;"""
+
+SELECT_HOST_CLAIMS = """SELECT DISTINCT claimed_by FROM FRONTIER WHERE claimed_by LIKE ?;"""
+RELEASE = """UPDATE FRONTIER SET claimed_by = NULL WHERE claimed_by = ?;"""
+
+# poem pages stay written, they are only fetched once
+RECRAWL = """
+UPDATE FRONTIER SET state = 'pending', retries = 0, next_attempt = 0, error = NULL, updated_at = ?
+WHERE kind IN ('poet', 'collection') AND state = 'written' AND url IN (SELECT value FROM json_each(?));
+"""
+
+RESET_FAILED = """
+UPDATE FRONTIER SET state = 'pending', retries = 0, next_attempt = 0, error = NULL, claimed_by = NULL
+WHERE state = 'failed';
+"""
+
+
+class Entry(object):
+    """
+    A claimed frontier entry with the name and tags of the page that linked to it
+    """
+
+    __slots__ = ('url', 'kind', 'name', 'tags', 'parent', 'retries', 'parent_kind', 'parent_name', 'parent_tags')
+
+    def __init__(self, url, kind, name, tags, parent, retries, parent_kind, parent_name, parent_tags):
+        self.url = url
+        self.kind = kind
+        self.name = name
+        self.tags = tags
+        self.parent = parent
+        self.retries = retries
+        self.parent_kind = parent_kind
+        self.parent_name = parent_name
+        self.parent_tags = parent_tags
+
+
+def parse_shard(text):
+    """
+    Returns (index, count) for a shard given as 'K/N', or None for no sharding
+    """
+    if not text:
+        return None
+    index, count = (int(part) for part in text.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f'shard {text} is not K/N with 0 <= K < N')
+    return index, count
+
+
+def shard_of(url):
+    return zlib.crc32(url.encode('utf-8'))
+
+
+def add(cursor, kind, urls, name=None, tags=None, parent=None, state=PENDING):
+    """
+    Adds urls of kind to the frontier, leaving any already there as they are
+    """
+    now = time.time()
+    cursor.executemany(INSERT_ENTRY, [(url, kind, name, tags, parent, shard_of(url), state, now) for url in urls])
+
+
+def recrawl(cursor, urls):
+    """
+    Queues the finished poet and collection pages among urls again, so their
+    pages are fetched for new poems. Returns how many there were
+    """
+    cursor.execute(RECRAWL, (time.time(), json.dumps(list(urls))))
+    return cursor.rowcount
+
+
+def _filters(shard, parent=None, parent_kinds=None, urls=None, parents=None):
+    statement = ""
+    params = []
+    if urls is not None:
+        statement += "\nAND F.url IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(urls)))
+    if parents is not None:
+        statement += "\nAND F.parent IN (SELECT value FROM json_each(?))"
+        params.append(json.dumps(list(parents)))
+    if shard:
+        statement += "\nAND F.shard % ? = ?"
+        params += [shard[1], shard[0]]
+    if parent:
+        statement += "\nAND F.parent = ?"
+        params.append(parent)
+    if parent_kinds:
+        statement += f"\nAND F.parent IN (SELECT url FROM FRONTIER WHERE kind IN ({','.join('?' * len(parent_kinds))}))"
+        params += parent_kinds
+    return statement, params
+
+
+def claim(cursor, kinds, limit=-1, shard=None, parent=None, parent_kinds=None, urls=None, parents=None):
+    """
+    Claims up to limit claimable entries of kinds for this worker in frontier order
+    and returns them as Entries. urls and parents, when given, limit the claim to
+    those entries or to entries linked from those pages
+    """
+    commit(cursor)
+    now = time.time()
+    filters, params = _filters(shard, parent, parent_kinds, urls, parents)
+    statement = SELECT_CLAIMABLE.format(kinds=','.join('?' * len(kinds)), claimable=CLAIMABLE, filters=filters)
+    cursor.execute("BEGIN IMMEDIATE;")
+    try:
+        rows = cursor.execute(statement, list(kinds) + [MAX_RETRIES, now, now - LEASE] + params + [limit]).fetchall()
+        cursor.executemany(CLAIM, [(WORKER, now, row[0]) for row in rows])
+    except BaseException:
+        cursor.execute("ROLLBACK;")
+        raise
+    cursor.execute("COMMIT;")
+    return [Entry(*row) for row in rows]
+
+
+def release_stale(cursor):
+    """
+    Releases the claims of workers on this host that are no longer running, or of an
+    earlier crawl in this process, so a restarted run doesn't wait out their leases.
+    Returns the workers released
+    """
+    host = WORKER.rsplit(':', 1)[0]
+    stale = []
+    for (worker,) in cursor.execute(SELECT_HOST_CLAIMS, (host + ':%',)).fetchall():
+        pid = int(worker.rsplit(':', 1)[1])
+        if worker != WORKER:
+            try:
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        stale.append(worker)
+    cursor.executemany(RELEASE, [(worker,) for worker in stale])
+    return stale
+
+
+def mark(cursor, url, state):
+    """
+    Moves url to state and releases its claim
+    """
+    cursor.execute(MARK, (state, time.time(), url))
+
+
+def fail(cursor, url, error):
+    """
+    Records a failed attempt at url, due for a retry after an exponential backoff
+    """
+    now = time.time()
+    cursor.execute(MARK_FAILED, (now, BACKOFF, str(error)[:256], now, url))
+
+
+def finish_parents(cursor):
+    """
+    Marks poets and collections written once none of their poems are left to do
+    """
+    cursor.execute(FINISH_PARENTS, (time.time(), MAX_RETRIES))
+
+
+def wait_time(cursor, kinds, shard=None, urls=None):
+    """
+    Returns the seconds to wait before more of the crawl of kinds may be claimable:
+    until the next failed page of kinds, or poem linked from one, is due a retry, or
+    a poll while other workers are expanding pages. None once nothing is left for
+    this worker. urls limits the crawl to those pages of kinds like in claim()
+    """
+    now = time.time()
+    waits = []
+    for entry_kinds, parent_kinds, scope, parents in [(kinds, None, urls, None), (['poem'], kinds, None, urls)]:
+        # the same entries claim() hands out for this crawl
+        filters, params = _filters(shard, parent_kinds=parent_kinds, urls=scope, parents=parents)
+        statement = SELECT_NEXT_RETRY.format(kinds=','.join('?' * len(entry_kinds)), filters=filters)
+        due = cursor.execute(statement, list(entry_kinds) + [MAX_RETRIES] + params).fetchone()[0]
+        if due is not None:
+            waits.append(max(0.0, due - now))
+    statement = SELECT_LIVE_CLAIMS.format(kinds=','.join('?' * len(kinds)))
+    if cursor.execute(statement, list(kinds) + [now - LEASE]).fetchone()[0]:
+        waits.append(POLL)
+    return min(waits) if waits else None
+
+
+def status(cursor):
+    """
+    Returns (kind, state, entries, retries) for every kind and state in the frontier
+    """
+    return cursor.execute(SELECT_STATUS).fetchall()
+
+
+def reset_failed(cursor):
+    """
+    Gives every failed entry a fresh set of retries, returns how many there were
+    """
+    cursor.execute(RESET_FAILED)
+    return cursor.rowcount
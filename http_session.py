@@ -0,0 +1,267 @@
+"""
+Shared HTTP session with persistent keep-alive connections used by the scrapers
+"""
+
+from __future__ import print_function
+
+import collections
+import gzip
+import http.client
+import threading
+import time
+import urllib.error
+import urllib.parse
+import zlib
+
+import logs
+import metrics
+import rate_limit
+
+TIMEOUT = 30
+MAX_IDLE_PER_HOST = 8
+MAX_REDIRECTS = 5
+MAX_THROTTLE_RETRIES = 4
+
+log = logs.get('http')
+
+DEFAULT_HEADERS = {
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+}
+
+# errors a pooled connection raises when the server already closed it
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+
+class Response(object):
+    """
+    A fully read HTTP response
+    """
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+
+class Session(object):
+    """
+    Keeps idle connections per scheme and host so consecutive requests reuse
+    the same TCP/TLS connection instead of paying a new handshake each time
+    """
+
+    def __init__(self, timeout=TIMEOUT, max_idle_per_host=MAX_IDLE_PER_HOST, limiter=None):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.cache = None
+        self.limiter = limiter or rate_limit.RateLimiter()
+        self._idle = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def get(self, url, headers=None):
+        """
+        Returns the Response for url, following redirects and consulting the page
+        cache if one is installed. Raises urllib.error.HTTPError for error statuses
+        and urllib.error.URLError if the host can't be reached
+        """
+        response = self._get(url, headers)
+        metrics.count('bytes_fetched', len(response.body))
+        return response
+
+    def _get(self, url, headers):
+        cached = self.cache.lookup(url) if self.cache else None
+        if cached and (cached.fresh or self.cache.offline):
+            self._count('cache_hits')
+            return Response(url, 200, {}, cached.body)
+        if self.cache and self.cache.offline:
+            self._count('cache_misses')
+            raise urllib.error.URLError(f'{url} is not in the page cache')
+        if cached:
+            headers = dict(headers or {})
+            headers.update(cached.validators())
+
+        response = self._follow(url, headers)
+        if response.status == 304 and cached:
+            self.cache.refresh(url)
+            self._count('cache_revalidated')
+            return Response(url, 200, response.headers, cached.body)
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, http.client.responses.get(response.status, ''),
+                                         response.headers, None)
+        if self.cache:
+            self._count('cache_misses')
+            self.cache.store(url, response.body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response
+
+    def stats(self):
+        """
+        Returns a dict of request and connection reuse counters
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        opened = stats.get('connections_opened', 0)
+        requests = stats.get('requests', 0)
+        stats['reuse_rate'] = (requests - opened) / requests if requests else 0.0
+        return stats
+
+    def close(self):
+        """
+        Closes every idle connection and the page cache
+        """
+        with self._lock:
+            idle = [conn for conns in self._idle.values() for conn in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
+    def _follow(self, url, headers):
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._limited_request(url, headers)
+            location = response.headers.get('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                self._count('redirects')
+                continue
+            return response
+        raise urllib.error.URLError(f'too many redirects for {url}')
+
+    def _limited_request(self, url, headers):
+        """
+        Sends a GET once the host's rate limiter allows it, backing off and retrying
+        while the host throttles us
+        """
+        for _ in range(MAX_THROTTLE_RETRIES + 1):
+            waited = self.limiter.acquire(url)
+            if waited:
+                metrics.get_stage('throttle').add(time.perf_counter() - waited, waited)
+            # only the network round trip, waits for the limiter are timed as throttle
+            with metrics.stage('fetch'):
+                response = self._request('GET', url, headers)
+            if not self.limiter.feedback(url, response.status, response.headers, response.body):
+                return response
+            self._count('throttled')
+        raise urllib.error.HTTPError(url, response.status if response.status >= 400 else 429,
+                                     'throttled', response.headers, None)
+
+    def _request(self, method, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        all_headers = dict(DEFAULT_HEADERS)
+        all_headers.update(headers or {})
+
+        conn, reused = self._acquire(key)
+        try:
+            try:
+                raw = self._send(conn, method, path, all_headers)
+            except _STALE_ERRORS:
+                if not reused:
+                    raise
+                # the server dropped the idle connection, retry once on a fresh one
+                conn.close()
+                self._count('stale_retries')
+                conn, reused = self._connect(key), False
+                raw = self._send(conn, method, path, all_headers)
+            body = raw.read()
+            self._count('requests')
+            self._count('bytes_wire', len(body))
+            # a truncated or corrupt gzip or deflate body fails like a dropped connection
+            body = _decode(body, raw.getheader('Content-Encoding'))
+        except (OSError, EOFError, zlib.error, http.client.HTTPException) as err:
+            conn.close()
+            raise urllib.error.URLError(err)
+
+        self._count('bytes_decoded', len(body))
+        if raw.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        return Response(url, raw.status, raw.headers, body)
+
+    @staticmethod
+    def _send(conn, method, path, headers):
+        conn.request(method, path, headers=headers)
+        return conn.getresponse()
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle[key]
+            if idle:
+                self._stats['connections_reused'] += 1
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _connect(self, key):
+        scheme, netloc = key
+        self._count('connections_opened')
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+        metrics.count(name, amount)
+
+
+def _decode(body, encoding):
+    """
+    Returns body decompressed according to its Content-Encoding
+    """
+    encoding = (encoding or '').strip().lower()
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # some servers send a raw deflate stream without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+SESSION = Session()
+
+
+def get(url, headers=None):
+    """
+    Fetches url through the shared SESSION
+    """
+    return SESSION.get(url, headers)
+
+
+def install_cache(cache):
+    """
+    Makes the shared SESSION read and write pages through cache, a page_cache.PageCache
+    """
+    SESSION.cache = cache
+
+
+def print_stats():
+    stats = SESSION.stats()
+    log.info(f"⇄ {stats.get('requests', 0)} requests over {stats.get('connections_opened', 0)} connections "
+             f"[{stats['reuse_rate']:.0%} reused]")
+    for host, limits in sorted(SESSION.limiter.stats().items()):
+        log.info(f"⇄ {host} {limits['rate']:.2f} req/s, {limits['backoffs']} backoffs, {limits['waited']:.0f}s waited")
+    if SESSION.cache:
+        log.info(f"⇄ cache {stats.get('cache_hits', 0)} hits, {stats.get('cache_revalidated', 0)} revalidated, "
+                 f"{stats.get('cache_misses', 0)} misses")
@@ -0,0 +1,60 @@
+"""
+Leveled logging for the scrapers. Messages keep their glyphs for people reading
+the terminal, --log_json switches to one JSON object per line with any fields
+passed through extra
+"""
+
+from __future__ import print_function
+
+import json
+import logging
+import sys
+import time
+
+ROOT = 'poetry'
+
+# attributes every LogRecord has, anything else came in through extra
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage().strip(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_FIELDS)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def get(name):
+    """
+    Returns the logger for a module
+    """
+    return logging.getLogger(f'{ROOT}.{name}')
+
+
+def configure(level='INFO', json_lines=False, stream=None):
+    """
+    Sends the scrapers' logs to stream, stdout by default
+    """
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_lines else logging.Formatter('%(message)s'))
+    root = logging.getLogger(ROOT)
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+
+
+def add_log_arguments(parser):
+    parser.add_argument("--log_level", type=str, default='INFO',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="least severe messages to show")
+    parser.add_argument("--log_json", action="store_true", help="log one JSON object per line")
+
+
+def configure_from_args(args):
+    configure(args.log_level, args.log_json)
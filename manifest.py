@@ -0,0 +1,50 @@
+"""
+High-water mark manifests that let export.py and azlyrics.py append only the
+entries added since their last run
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import time
+
+
+def path_for(out):
+    return out + '.manifest.json'
+
+
+def load(out, database, filters=None):
+    """
+    Returns the manifest of out if it still describes the file on disk for the same
+    database and filters, otherwise None so the caller writes out in full
+    """
+    path = path_for(out)
+    if not os.path.exists(path) or not os.path.exists(out):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('database') != os.path.abspath(database) or manifest.get('filters') != (filters or {}):
+        print(f'↻ {out} was written from another database or filters')
+        return None
+    if manifest.get('bytes') != os.path.getsize(out):
+        print(f'↻ {out} changed since its manifest was written')
+        return None
+    return manifest
+
+
+def save(out, database, last_id, count, filters=None):
+    """
+    Records that out holds count entries covering every id up to last_id
+    """
+    manifest = {
+        'database': os.path.abspath(database),
+        'filters': filters or {},
+        'last_id': last_id,
+        'count': count,
+        'bytes': os.path.getsize(out),
+        'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(path_for(out), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,206 @@
+"""
+Per-stage latency histograms and counters for the scrapers. Stages are timed
+where the work happens: fetch in http_session, parse around BeautifulSoup and
+find_poem, write around each record, throttle for rate limiter waits. A run's
+metrics are written as a JSON line or a Prometheus-style text file
+"""
+
+from __future__ import print_function
+
+import bisect
+import collections
+import contextlib
+import json
+import threading
+import time
+
+# upper bounds in seconds of the histogram buckets, the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = 'poetry'
+
+
+class Histogram(object):
+    """
+    Counts observations into fixed buckets and keeps their sum
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """
+        Returns the upper bound of the bucket holding the q quantile
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class Stage(object):
+    """
+    Counts the items a stage handled, the time it spent busy and how long each took
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self.started = None
+        self.latency = Histogram()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timing(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(start)
+
+    def add(self, start, busy=None):
+        """
+        Records one item that started being worked on at start and took busy
+        seconds of work, by default everything since start
+        """
+        with self._lock:
+            if self.started is None:
+                self.started = start
+            busy = time.perf_counter() - start if busy is None else busy
+            self.count += 1
+            self.busy += busy
+            self.latency.observe(busy)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started if self.started is not None else 0.0
+
+    def report(self):
+        elapsed = self.elapsed()
+        rate = self.count / elapsed if elapsed else 0.0
+        return (f'{self.name} {self.count} [{rate:.1f}/s, {self.busy:.1f}s busy, '
+                f'p50 {self.latency.quantile(0.5) * 1000:.0f}ms, p99 {self.latency.quantile(0.99) * 1000:.0f}ms]')
+
+
+STAGES = collections.OrderedDict((name, Stage(name)) for name in ['fetch', 'parse', 'write'])
+COUNTERS = collections.Counter()
+_lock = threading.Lock()
+
+
+def get_stage(name):
+    with _lock:
+        found = STAGES.get(name)
+        if found is None:
+            found = STAGES[name] = Stage(name)
+        return found
+
+
+def stage(name):
+    """
+    Returns a context manager timing one item of the named stage
+    """
+    return get_stage(name).timing()
+
+
+def count(name, amount=1):
+    """
+    Adds amount to the named counter, e.g. bytes_fetched or db_rows
+    """
+    with _lock:
+        COUNTERS[name] += amount
+
+
+def reset():
+    with _lock:
+        STAGES.clear()
+        STAGES.update((name, Stage(name)) for name in ['fetch', 'parse', 'write'])
+        COUNTERS.clear()
+
+
+def snapshot():
+    """
+    Returns every stage and counter as a dict, with the derived rates
+    """
+    with _lock:
+        stages = list(STAGES.values())
+        counters = dict(COUNTERS)
+    fetch = STAGES.get('fetch')
+    write = STAGES.get('write')
+    fetch_elapsed = fetch.elapsed() if fetch else 0.0
+    write_elapsed = write.elapsed() if write else 0.0
+    lookups = sum(counters.get(name, 0) for name in ('cache_hits', 'cache_misses', 'cache_revalidated'))
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'stages': {s.name: {'count': s.count, 'busy': s.busy, 'elapsed': s.elapsed(),
+                            'buckets': dict(zip([str(b) for b in s.latency.buckets] + ['+Inf'], s.latency.counts)),
+                            'p50': s.latency.quantile(0.5), 'p99': s.latency.quantile(0.99)}
+                   for s in stages if s.count},
+        'counters': counters,
+        'pages_per_second': fetch.count / fetch_elapsed if fetch_elapsed else 0.0,
+        'db_rows_per_second': counters.get('db_rows', 0) / write_elapsed if write_elapsed else 0.0,
+        'cache_hit_rate': counters.get('cache_hits', 0) / lookups if lookups else 0.0,
+    }
+
+
+def prometheus(data=None):
+    """
+    Returns the metrics in the Prometheus text exposition format
+    """
+    data = data or snapshot()
+    out = [f'# TYPE {PREFIX}_stage_seconds histogram']
+    for name, stage_data in data['stages'].items():
+        cumulative = 0
+        for bound, value in stage_data['buckets'].items():
+            cumulative += value
+            out.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+        out.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {stage_data["busy"]}')
+        out.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {stage_data["count"]}')
+    for name, value in sorted(data['counters'].items()):
+        out.append(f'# TYPE {PREFIX}_{name}_total counter')
+        out.append(f'{PREFIX}_{name}_total {value}')
+    for name in ('pages_per_second', 'db_rows_per_second', 'cache_hit_rate'):
+        out.append(f'# TYPE {PREFIX}_{name} gauge')
+        out.append(f'{PREFIX}_{name} {data[name]}')
+    return '\n'.join(out) + '\n'
+
+
+def write(path):
+    """
+    Writes the metrics to path, as Prometheus text if it ends in .prom and
+    otherwise appended as one JSON line per run
+    """
+    data = snapshot()
+    if path.endswith('.prom'):
+        with open(path, 'w') as f:
+            f.write(prometheus(data))
+    else:
+        with open(path, 'a') as f:
+            f.write(json.dumps(data) + '\n')
+    return data
+
+
+def report():
+    """
+    Returns one line summarizing every stage that did any work
+    """
+    stages = [s for s in STAGES.values() if s.count]
+    if not stages:
+        return None
+    return '⚙ ' + ' | '.join(s.report() for s in stages)
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics", type=str,
+                        help="write run metrics here, Prometheus text for .prom files and JSON lines otherwise")
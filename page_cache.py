@@ -0,0 +1,165 @@
+"""
+On-disk cache of fetched pages keyed by url, stored compressed in sqlite
+"""
+
+from __future__ import print_function
+
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+
+CACHE_DATABASE = "page_cache.db"
+TTL = 24 * 60 * 60
+MAX_BYTES = 512 * 1024 * 1024
+
+CREATE_PAGES = """
+CREATE TABLE IF NOT EXISTS PAGES
+       (key CHAR(40) PRIMARY KEY,
+       url VARCHAR(512),
+       body BLOB,
+       size INTEGER,
+       etag VARCHAR(256),
+       last_modified VARCHAR(64),
+       fetched_at REAL,
+       accessed_at REAL);
+"""
+CREATE_PAGES_ACCESSED = """CREATE INDEX IF NOT EXISTS PAGES_ACCESSED ON PAGES (accessed_at);"""
+
+SELECT_PAGE = """SELECT body, etag, last_modified, fetched_at FROM PAGES WHERE key = ?;"""
+UPSERT_PAGE = """INSERT OR REPLACE INTO PAGES (key, url, body, size, etag, last_modified, fetched_at, accessed_at)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?);"""
+TOUCH_PAGE = """UPDATE PAGES SET accessed_at = ? WHERE key = ?;"""
+REFRESH_PAGE = """UPDATE PAGES SET fetched_at = ?, accessed_at = ? WHERE key = ?;"""
+SELECT_PAGES = """SELECT url, body FROM PAGES ORDER BY url;"""
+SELECT_TOTAL_SIZE = """SELECT coalesce(sum(size), 0) FROM PAGES;"""
+SELECT_OLDEST = """SELECT key, size FROM PAGES ORDER BY accessed_at LIMIT ?;"""
+DELETE_PAGE = """DELETE FROM PAGES WHERE key = ?;"""
+
+
+class CachedPage(object):
+    """
+    A cached page body with its validators
+    """
+
+    def __init__(self, body, etag, last_modified, fetched_at, ttl):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+        self.fresh = time.time() - fetched_at < ttl
+
+    def validators(self):
+        """
+        Returns the conditional request headers for revalidating this page
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageCache(object):
+    """
+    Url keyed page store with a freshness ttl and least-recently-used eviction
+    once the compressed bodies exceed max_bytes. When offline, every lookup is
+    served from disk regardless of age
+    """
+
+    def __init__(self, path=CACHE_DATABASE, ttl=TTL, max_bytes=MAX_BYTES, offline=False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute(CREATE_PAGES)
+        self._conn.execute(CREATE_PAGES_ACCESSED)
+        self._size = self._conn.execute(SELECT_TOTAL_SIZE).fetchone()[0]
+
+    def lookup(self, url):
+        """
+        Returns the CachedPage for url or None if it isn't cached
+        """
+        key = _key_for(url)
+        with self._lock:
+            row = self._conn.execute(SELECT_PAGE, (key,)).fetchone()
+            if not row:
+                return None
+            self._conn.execute(TOUCH_PAGE, (time.time(), key))
+        body, etag, last_modified, fetched_at = row
+        return CachedPage(zlib.decompress(body), etag, last_modified, fetched_at, self.ttl)
+
+    def store(self, url, body, etag=None, last_modified=None):
+        """
+        Stores body for url and evicts the least recently used pages if over max_bytes
+        """
+        key = _key_for(url)
+        packed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            previous = self._conn.execute("SELECT size FROM PAGES WHERE key = ?;", (key,)).fetchone()
+            self._conn.execute(UPSERT_PAGE, (key, url, packed, len(packed), etag, last_modified, now, now))
+            self._size += len(packed) - (previous[0] if previous else 0)
+            self._evict()
+
+    def refresh(self, url):
+        """
+        Marks the cached page for url as fresh after a 304 revalidation
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(REFRESH_PAGE, (now, now, _key_for(url)))
+
+    def pages(self):
+        """
+        Returns (url, body) for every cached page
+        """
+        with self._lock:
+            rows = self._conn.execute(SELECT_PAGES).fetchall()
+        return [(url, zlib.decompress(body)) for url, body in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        while self._size > self.max_bytes:
+            oldest = self._conn.execute(SELECT_OLDEST, (64,)).fetchall()
+            if not oldest:
+                self._size = 0
+                return
+            for key, size in oldest:
+                self._conn.execute(DELETE_PAGE, (key,))
+                self._size -= size
+                if self._size <= self.max_bytes:
+                    return
+
+
+def _key_for(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def add_cache_arguments(parser):
+    """
+    Adds the page cache options to an argparse parser
+    """
+    parser.add_argument("--cache", type=str, default=CACHE_DATABASE, help="page cache database")
+    parser.add_argument("--no_cache", action="store_true", help="always fetch pages from the network")
+    parser.add_argument("--cache_ttl", type=float, default=TTL / 3600, help="hours before a cached page is revalidated")
+    parser.add_argument("--cache_mb", type=int, default=MAX_BYTES // (1024 * 1024), help="max page cache size in MB")
+    parser.add_argument("--offline", action="store_true", help="replay pages from the cache without any network")
+
+
+def cache_from_args(args):
+    """
+    Returns the PageCache described by parsed add_cache_arguments options or None
+    """
+    if args.no_cache and not args.offline:
+        return None
+    return PageCache(args.cache, ttl=args.cache_ttl * 3600, max_bytes=args.cache_mb * 1024 * 1024,
+                     offline=args.offline)
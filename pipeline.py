@@ -0,0 +1,152 @@
+"""
+Fetch, parse and write stages that let scrape.py use every core. Pages are
+fetched by threads, parsed into Poem records by a process pool and handed back
+in order to the caller, which stays the single writer owning the sqlite connection
+"""
+
+from __future__ import print_function
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fetch
+import logs
+import metrics
+
+log = logs.get('pipeline')
+
+QUEUE_SIZE = 32
+
+# number of parse processes, 0 parses in the calling process
+PROCS = 0
+
+_DONE = object()
+_pool = None
+
+
+def configure(procs=None, queue_size=None):
+    """
+    Sets the number of parse processes and the size of the queues between stages
+    """
+    global PROCS, QUEUE_SIZE
+    if procs is not None:
+        PROCS = max(0, procs)
+    if queue_size:
+        QUEUE_SIZE = max(1, queue_size)
+
+
+def parse_page(url, page, parser):
+    """
+    Returns the (poem, author) parsed from page, run inside a parse process
+    """
+    import scrape
+    scrape.set_parser(parser)
+    soup = scrape.soup_from(page)
+    if not soup:
+        return None, None
+    return scrape.find_poem(soup, url), scrape._author_from(soup)
+
+
+def _timed_parse_page(url, page, parser):
+    start = time.perf_counter()
+    poem, author = parse_page(url, page, parser)
+    return poem, author, time.perf_counter() - start
+
+
+def parsed_poems(urls):
+    """
+    Fetches and parses urls, yielding (url, poem, author) in the order of urls.
+    poem is None for pages that couldn't be fetched or parsed
+    """
+    import scrape
+    fetched = _fetched(urls)
+    if not PROCS:
+        for url, page in fetched:
+            with metrics.stage('parse'):
+                poem, author = parse_page(url, page, scrape.PARSER)
+            yield url, poem, author
+        return
+
+    pool = _parse_pool()
+    pending = collections.deque()
+    for url, page in fetched:
+        pending.append((url, time.perf_counter(), pool.submit(_timed_parse_page, url, page, scrape.PARSER)))
+        # bound the pages in flight so a slow writer pushes back on fetching
+        if len(pending) >= QUEUE_SIZE:
+            yield _parsed(*pending.popleft())
+    while pending:
+        yield _parsed(*pending.popleft())
+
+
+def _parsed(url, submitted, future):
+    poem, author, busy = future.result()
+    metrics.get_stage('parse').add(submitted, busy)
+    return url, poem, author
+
+
+def _fetched(urls):
+    """
+    Runs fetch.fetch_pages on a feeder thread and yields its pages from a bounded queue
+    """
+    pages = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        try:
+            fetching = fetch.fetch_pages(urls)
+            # each request is timed as a fetch by http_session
+            for item in fetching:
+                if not put(item):
+                    return
+        except Exception as err:
+            errors.append(err)
+        put(_DONE)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        while True:
+            item = pages.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+    if errors:
+        raise errors[0]
+
+
+def _parse_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCS)
+    return _pool
+
+
+def shutdown():
+    """
+    Stops the parse processes
+    """
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def print_report():
+    summary = metrics.report()
+    if summary:
+        log.info(summary)
@@ -2,24 +2,78 @@
 A generic poem class
 """
 
+import sys
+
+# whether record constructors share one copy of each author name
+INTERN_AUTHORS = False
+
+
+def set_intern_authors(enabled):
+    """
+    Sets whether Poem and Song records intern their author names, which pays off
+    when loading many records by the same few authors
+    """
+    global INTERN_AUTHORS
+    INTERN_AUTHORS = bool(enabled)
+
+
+def intern_author(name):
+    if INTERN_AUTHORS and isinstance(name, str):
+        return sys.intern(name)
+    return name
+
+
 class Poem(object):
     """
-    A generic poem class
+    A generic poem class. The text is kept once, as the newline joined lines, and
+    lines are split from it when asked for. They come as a tuple, edits go through
+    assigning lines or text
     """
 
+    __slots__ = ('title', 'author', 'url', 'year', 'translator', 'source', 'id', '_text', '_lines')
+
     def __init__(self, title, lines=None, author=None, url=None, year=None,
                  translator=None, source=None, text=None, id=None):
-        if lines is None:
-            lines = []
         self.title = title
-        self.author = author
-        self.lines = lines
+        self.author = intern_author(author)
         self.url = url
         self.year = year
         self.translator = translator
         self.source = source
-        self.text = text
         self.id = id
+        self._lines = None
+        if text:
+            self._text = text
+            # both given, keep the lines as they were rather than what text splits into
+            if lines is not None and lines != text.split('\n'):
+                self._lines = tuple(lines)
+        else:
+            self.lines = lines or []
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, text):
+        self._text = text or None
+        self._lines = None
+
+    @property
+    def lines(self):
+        if self._lines is not None:
+            return self._lines
+        return () if self._text is None else tuple(self._text.split('\n'))
+
+    @lines.setter
+    def lines(self, lines):
+        self._text = "\n".join(lines) if lines else None
+        self._lines = None
+
+    def num_lines(self):
+        if self._lines is not None:
+            return len(self._lines)
+        return 0 if self._text is None else self._text.count('\n') + 1
 
     def full_text(self):
-        return self.text or "\n".join(self.lines)
+        return self._text or "\n".join(self.lines)
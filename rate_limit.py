@@ -0,0 +1,146 @@
+"""
+Adaptive per-host rate limiting shared by the scrapers. Each host gets a token
+bucket whose rate grows additively while responses are healthy and is cut
+multiplicatively when the host throttles us (429/503 or a captcha page)
+"""
+
+from __future__ import print_function
+
+import re
+import threading
+import time
+import urllib.parse
+
+# requests per second as (initial, min, max) per host
+DEFAULT_RATES = (4.0, 0.1, 16.0)
+HOST_RATES = {
+    'www.azlyrics.com': (0.1, 0.02, 0.5),
+    'azlyrics.com': (0.1, 0.02, 0.5),
+}
+
+INCREASE = 0.05
+DECREASE = 0.5
+
+THROTTLE_STATUSES = (429, 503)
+# markers of the block page a host serves with a 200 instead of a 429, per host. Only
+# the page's own title or a form posting to its captcha check count, a poem that
+# mentions a captcha or embeds a captcha widget is an ordinary page
+_AZLYRICS_BLOCK = re.compile(rb'<title>\s*AZLyrics\s*-\s*request for access'
+                             rb'|<form[^>]*\baction="[^"]*captcha', re.IGNORECASE)
+CAPTCHA_PATTERNS = {
+    'www.azlyrics.com': _AZLYRICS_BLOCK,
+    'azlyrics.com': _AZLYRICS_BLOCK,
+}
+CAPTCHA_SCAN_BYTES = 64 * 1024
+
+
+class HostBucket(object):
+    """
+    Token bucket for one host with additive-increase/multiplicative-decrease rate
+    """
+
+    def __init__(self, rate, min_rate, max_rate, increase=INCREASE, decrease=DECREASE):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase * max_rate
+        self.decrease = decrease
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.requests = 0
+        self.backoffs = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until the next request to this host may be sent, returns seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+            self.requests += 1
+            self.waited += wait
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def healthy(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.backoffs += 1
+            self.paused_until = time.monotonic() + (retry_after if retry_after else 1 / self.rate)
+
+    def stats(self):
+        with self._lock:
+            return {'rate': self.rate, 'requests': self.requests, 'backoffs': self.backoffs, 'waited': self.waited}
+
+
+class RateLimiter(object):
+    """
+    Hands out a HostBucket per host
+    """
+
+    def __init__(self, host_rates=None, default_rates=DEFAULT_RATES):
+        self.host_rates = dict(HOST_RATES if host_rates is None else host_rates)
+        self.default_rates = default_rates
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = HostBucket(*self.host_rates.get(host, self.default_rates))
+                self._buckets[host] = bucket
+            return bucket
+
+    def acquire(self, url):
+        return self.bucket(url).acquire()
+
+    def feedback(self, url, status, headers, body):
+        """
+        Adjusts the rate for the host of url from a response, returns True if it was throttled
+        """
+        bucket = self.bucket(url)
+        if is_throttled(status, body, urllib.parse.urlsplit(url).netloc.lower()):
+            bucket.throttled(_retry_after(headers))
+            return True
+        bucket.healthy()
+        return False
+
+    def stats(self):
+        """
+        Returns the current rate, request, backoff and wait counters per host
+        """
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {host: bucket.stats() for host, bucket in buckets.items()}
+
+
+def is_throttled(status, body, host=None):
+    """
+    Returns True if a response is the host asking us to slow down, by status or by
+    the block page of a host in CAPTCHA_PATTERNS
+    """
+    if status in THROTTLE_STATUSES:
+        return True
+    pattern = CAPTCHA_PATTERNS.get(host)
+    return status == 200 and pattern is not None and bool(body) and bool(pattern.search(body[:CAPTCHA_SCAN_BYTES]))
+
+
+def _retry_after(headers):
+    value = headers.get('Retry-After') if headers else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
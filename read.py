@@ -3,55 +3,77 @@ Functions for reading from poetry database
 """
 
 from __future__ import print_function
+import random
 import sqlite3
-from sql_util import DATABASE
+import sys
+from array import array
+from sql_util import DATABASE, check_schema, connect_readonly
 
 from poem import Poem
 
 MAX_LINES = 10000
 LINE_LENGTH = 256
 
-SELECT_POEM_LINES = """SELECT poem_line FROM LINES WHERE pid = ?;"""
-SELECT_POEMS_BASE = """SELECT PM.pid, PM.poem_name, PT.poet_name, PM.translator, PM.year,
-                        PM.source, PM.url
-                        FROM POEMS AS PM JOIN POETS AS PT ON PT.PID = PM.poet_id
-                        JOIN LINES L ON L.pid = PM.pid
-                        WHERE PM.num_lines <= ?"""
-GROUP_BY_CHAR_COUNT = """GROUP BY PM.pid HAVING sum(LENGTH(L.poem_line)) <= ?"""
-SELECT_POEMS_POET_BASE = SELECT_POEMS_BASE + """AND PT.poet_name = ? """
-ORDER_RANDOM = """ORDER BY RANDOM() LIMIT 1"""
+SELECT_ELIGIBLE = """SELECT pid FROM POEM_STATS WHERE num_lines <= ? AND num_chars <= ?;"""
+SELECT_ELIGIBLE_POET = """SELECT S.pid FROM POEM_STATS AS S JOIN POETS AS PT ON PT.pid = S.poet_id
+                          WHERE PT.poet_name = ? AND S.num_lines <= ? AND S.num_chars <= ?;"""
+SELECT_LATEST_POEM = """SELECT coalesce(max(pid), 0) FROM POEMS;"""
+SELECT_POEM_WITH_LINES = """SELECT PM.pid, PM.poem_name, PT.poet_name, PM.translator, PM.year,
+                            PM.source, PM.url, L.poem_line
+                            FROM POEMS AS PM JOIN POETS AS PT ON PT.PID = PM.poet_id
+                            JOIN LINES L ON L.pid = PM.pid
+                            WHERE PM.pid = ? ORDER BY L.lid;"""
 
-SELECT_RANDOM_POEM = SELECT_POEMS_BASE + GROUP_BY_CHAR_COUNT + ORDER_RANDOM + ";"
-SELECT_RANDOM_POEM_POET = SELECT_POEMS_POET_BASE + GROUP_BY_CHAR_COUNT + ORDER_RANDOM + ";"
+# eligible pids per (database, author, max_lines, max_characters), with the latest pid they cover
+_eligible = {}
+
+
+def eligible_pids(cursor, author, max_lines, max_characters):
+    """
+    Returns an array of the pids of poems by author (any if None) within max_lines
+    and max_characters, cached until new poems are added
+    """
+    latest = cursor.execute(SELECT_LATEST_POEM).fetchone()[0]
+    key = (DATABASE, author, max_lines, max_characters)
+    cached = _eligible.get(key)
+    if cached and cached[0] == latest:
+        return cached[1]
+
+    check_schema(cursor)
+    if author:
+        rows = cursor.execute(SELECT_ELIGIBLE_POET, (author, max_lines, max_characters))
+    else:
+        rows = cursor.execute(SELECT_ELIGIBLE, (max_lines, max_characters))
+    pids = array('q', (row[0] for row in rows))
+    _eligible[key] = (latest, pids)
+    return pids
 
 
 def get_random_poem(author=None, max_lines=MAX_LINES, line_length=LINE_LENGTH):
     """
     Returns a random Poem from the DATABASE of max length max_lines and from
-    author if given. Returns None if no poems found
+    author if given. Returns None if no poems found. Raises sqlite3.DatabaseError
+    if the DATABASE needs migrating
     """
-    conn = sqlite3.connect(DATABASE)
+    conn = connect_readonly(DATABASE)
     cursor = conn.cursor()
     max_characters = max_lines * line_length
 
-    result = None
-    if author:
-        result = cursor.execute(SELECT_RANDOM_POEM_POET, (max_lines, author, max_characters))
-    else:
-        result = cursor.execute(SELECT_RANDOM_POEM, (max_lines, max_characters))
-    poem_array = result.fetchone()
+    try:
+        pids = eligible_pids(cursor, author, max_lines, max_characters)
+        if not pids:
+            print("query for poem failed")
+            return None
+        rows = cursor.execute(SELECT_POEM_WITH_LINES, (random.choice(pids),)).fetchall()
+    finally:
+        cursor.close()
+        conn.close()
 
-    if not poem_array:
+    if not rows:
         print("query for poem failed")
         return None
-    poem_id, title, author, translator, year, source, url = poem_array
-
-    lines = []
-    for row in cursor.execute(SELECT_POEM_LINES, (poem_id,)):
-        lines.append(row[0])
-
-    cursor.close()
-    conn.commit()
+    poem_id, title, author, translator, year, source, url, _ = rows[0]
+    lines = [row[-1] for row in rows]
 
     poem = Poem(title=title, author=author, lines=lines, translator=translator,
                 year=year, source=source, url=url)
@@ -62,4 +84,7 @@ def get_random_poem(author=None, max_lines=MAX_LINES, line_length=LINE_LENGTH):
 
 
 if __name__ == '__main__':
-    get_random_poem('Jorie Graham')
+    try:
+        get_random_poem('Jorie Graham')
+    except sqlite3.DatabaseError as err:
+        sys.exit(str(err))
@@ -7,17 +7,23 @@ from __future__ import print_function
 
 import sqlite3
 import urllib.error
-import urllib.parse
-import urllib.request
 from html import unescape
 import argparse
+import importlib.util
 import os
 import re
-
-from bs4 import BeautifulSoup
-
+import time
+
+import fetch
+import frontier
+import http_session
+import logs
+import metrics
+import page_cache
+import pipeline
 from poem import Poem
 from sql_util import *
+from store import SELECT_POEM_ID_BY_URL, create_poet, create_tables, drop_tables, load_poem_urls, tag_poem, write_poem
 
 POET_URL = "https://www.poetryfoundation.org/poets/%s#about"
 COLLECTION_URL = "https://www.poetryfoundation.org/collections/%s"
@@ -25,22 +31,16 @@ COLLECTION_URL = "https://www.poetryfoundation.org/collections/%s"
 POETS = "poets.txt"
 COLLECTIONS = "collections.txt"
 
-INSERT_LINE = """INSERT INTO LINES (lid, pid, poem_line) VALUES (?, ?, ?);"""
-INSERT_TAG = """INSERT INTO TAGS (pid, name) VALUES (?, ?);"""
-INSERT_POEM = """INSERT INTO POEMS (poem_name, poet_id, num_lines%s) VALUES (?, ?, ?%s);"""
-INSERT_POET_DEAD = """INSERT INTO POETS (poet_name, born, died) VALUES (?, ?, ?);"""
-INSERT_POET_ALIVE = """INSERT INTO POETS (poet_name, born) VALUES (?, ?);"""
-INSERT_POET = """INSERT INTO POETS (poet_name) VALUES (?);"""
-
-SELECT_POET_ID = """SELECT PID FROM POETS WHERE poet_name = ?;"""
-SELECT_POET_EXISTS = """SELECT * FROM POETS WHERE poet_name = ?;"""
+# poem entries claimed from the frontier at a time when no poet or collection is left
+CRAWL_BATCH = 64
 
-SELECT_POEM_ID = """SELECT PID FROM POEMS WHERE poem_name = ? AND poet_id = ?;"""
-SELECT_POEM_EXISTS = """SELECT * FROM POEMS WHERE poem_name = ? AND poet_id = ?;"""
+WHITESPACE = '[ \t\n\r]+'
 
-SELECT_TAG_EXISTS = """SELECT * FROM TAGS WHERE name = ?;"""
+PARSERS = ["lxml", "html.parser"]
+# looked up without importing it, lxml is loaded with bs4 on the first parse
+PARSER = "lxml" if importlib.util.find_spec("lxml") else "html.parser"
 
-WHITESPACE = '[ \t\n\r]+'
+log = logs.get('scrape')
 
 
 def main():
@@ -54,68 +54,213 @@ def main():
     parser.add_argument("-c", "--collection", action="store_true", help="parse a collection")
     parser.add_argument("-t", "--tag", type=str, help="tag(s) to add to this collection, csv")
     parser.add_argument("-s", "--start_with", type=str, help="when batched, start after this poet")
+    parser.add_argument("-w", "--workers", type=int, default=fetch.WORKERS, help="concurrent poem page fetches")
+    parser.add_argument("--per_host", type=int, default=fetch.PER_HOST, help="max concurrent requests per host")
+    parser.add_argument("-p", "--parse_procs", type=int, default=pipeline.PROCS,
+                        help="processes parsing poem pages, 0 parses inline")
+    parser.add_argument("--queue_size", type=int, default=pipeline.QUEUE_SIZE, help="pages buffered between stages")
+    parser.add_argument("--parser", type=str, choices=PARSERS, default=PARSER, help="BeautifulSoup tree builder")
+    parser.add_argument("--commit_every", type=int, default=GROUP_COMMIT, help="poems written per transaction")
+    parser.add_argument("--shard", type=str, help="when batched, only crawl frontier shard K/N by url hash")
+    parser.add_argument("--frontier_status", action="store_true", help="print the crawl frontier and exit")
+    parser.add_argument("--retry_failed", action="store_true", help="give failed frontier pages fresh retries")
+    page_cache.add_cache_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    logs.add_log_arguments(parser)
 
     args = parser.parse_args()
+    try:
+        shard = frontier.parse_shard(args.shard)
+    except ValueError as err:
+        parser.error(str(err))
+    logs.configure_from_args(args)
+    fetch.configure(workers=args.workers, per_host=args.per_host)
+    http_session.install_cache(page_cache.cache_from_args(args))
+    set_group_commit(args.commit_every)
+    set_parser(args.parser)
+    pipeline.configure(procs=args.parse_procs, queue_size=args.queue_size)
 
     if (args.fresh or args.full_run) and os.path.exists(DATABASE):
         conn = sqlite3.connect(DATABASE, isolation_level=None)  # auto commit
         cursor = conn.cursor()
         drop_tables(cursor)
-        os.remove(DATABASE)
-        print(f'deleted {DATABASE}')
         conn.commit()
         cursor.close()
+        conn.close()
+        for path in [DATABASE, DATABASE + '-wal', DATABASE + '-shm']:
+            if os.path.exists(path):
+                os.remove(path)
+        log.info(f'deleted {DATABASE}')
 
-    conn = sqlite3.connect(DATABASE, isolation_level=None)  # auto commit
+    conn = sqlite3.connect(DATABASE, isolation_level=None)  # transactions are managed by sql_util.record
     cursor = conn.cursor()
+    enable_wal(cursor)
     create_tables(cursor)
+    load_poem_urls(cursor)
 
-    if args.full_run:
-        batch_run(cursor, args.start_with)
-        batch_collections(cursor)
-    elif args.collection:
-        if args.batch:
-            batch_collections(cursor)
-        else:
-            if not args.tag:
-                raise Exception("You should tag collections")
-            col_id = input('enter collection id')
-            add_poem_collection(col_id, args.tag, cursor)
-    else:
-        if args.batch:
-            batch_run(cursor, args.start_with)
-        else:
-            poet = input('enter poet name')
-            add_poet_poems(poet, cursor)
+    if args.frontier_status:
+        for kind, state, entries, retries in frontier.status(cursor):
+            print(f'{kind:<12}{state:<10}{entries:>8}{retries:>8} retries')
+        return
+    if args.retry_failed:
+        log.info(f'↻ {frontier.reset_failed(cursor)} failed pages to retry')
 
-    conn.commit()
-    cursor.close()
+    try:
+        if args.full_run:
+            batch_run(cursor, args.start_with, shard)
+            batch_collections(cursor, shard)
+        elif args.collection:
+            if args.batch:
+                batch_collections(cursor, shard)
+            else:
+                if not args.tag:
+                    raise Exception("You should tag collections")
+                col_id = input('enter collection id')
+                add_poem_collection(col_id, args.tag, cursor)
+        else:
+            if args.batch:
+                batch_run(cursor, args.start_with, shard)
+            else:
+                poet = input('enter poet name')
+                add_poet_poems(poet, cursor)
+    finally:
+        # keep every fully written poem of an interrupted run
+        commit(cursor)
+        cursor.close()
+        pipeline.shutdown()
+    http_session.print_stats()
+    pipeline.print_report()
+    if args.metrics:
+        metrics.write(args.metrics)
+        log.info(f'⚙ wrote metrics to {args.metrics}')
 
 
-def batch_run(cursor, start_with=None):
+def batch_run(cursor, start_with=None, shard=None):
     """
-    Batch opens poets from in POETS adds their poems to cursor
+    Batch opens poets from in POETS adds their poems to cursor. The poets go into
+    the crawl frontier first, so an interrupted run picks up where it stopped, and
+    poets finished by an earlier run are fetched again for new poems. With
+    start_with, only the poets from there on are crawled
     """
     ready = start_with is None
+    urls = []
     with open(POETS, "r") as poet_file:
         poets = poet_file.readlines()
         if not ready:
-            print(f'skipping until {start_with}')
-        for poet in poets:
-            if not ready and re.search(rf'{start_with}', poet, re.IGNORECASE):
-                ready = True
-            if ready and not poet.startswith('#'):
-                add_poet_poems(poet, cursor)
-            else:
-                print(f'skip {poet}')
-
-
-def batch_collections(cursor):
+            log.info(f'skipping until {start_with}')
+        with record(cursor):
+            for poet in poets:
+                if not ready and re.search(rf'{start_with}', poet, re.IGNORECASE):
+                    ready = True
+                if ready and not poet.startswith('#'):
+                    url = POET_URL % poet_name_to_dashes(poet.rstrip('\n'))
+                    frontier.add(cursor, 'poet', [url], name=poet)
+                    urls.append(url)
+                else:
+                    log.debug(f'skip {poet}')
+            requeued = frontier.recrawl(cursor, urls)
+    if requeued:
+        log.info(f'↻ {requeued} poets to check for new poems', extra={'requeued': requeued})
+    # poets before start_with that an earlier run left pending stay for a later run
+    crawl(cursor, ['poet'], shard, urls if start_with is not None else None)
+
+
+def batch_collections(cursor, shard=None):
+    urls = []
     with open(COLLECTIONS, "r") as cols_file:
         cols = cols_file.readlines()
-        for line in cols:
-            match = re.search("(?P<id>\\d+):(?P<tags>.*)", line)
-            add_poem_collection(match.group('id'), match.group('tags'), cursor)
+        with record(cursor):
+            for line in cols:
+                match = re.search("(?P<id>\\d+):(?P<tags>.*)", line)
+                url = COLLECTION_URL % match.group('id')
+                frontier.add(cursor, 'collection', [url], name=match.group('id'), tags=match.group('tags'))
+                urls.append(url)
+            requeued = frontier.recrawl(cursor, urls)
+    if requeued:
+        log.info(f'↻ {requeued} collections to check for new poems', extra={'requeued': requeued})
+    crawl(cursor, ['collection'], shard)
+
+
+def crawl(cursor, kinds, shard=None, urls=None):
+    """
+    Works through the frontier: expands the poet or collection pages of kinds into
+    their poem urls and writes the poems, until nothing is left to claim. Waits out
+    the backoff of failed pages that still have retries. urls, when given, limits
+    the crawl to those pages and their poems
+    """
+    for worker in frontier.release_stale(cursor):
+        log.info(f'↻ released the claims of {worker}', extra={'worker': worker})
+    while True:
+        parents = frontier.claim(cursor, kinds, 1, shard, urls=urls)
+        for parent in parents:
+            if expand_parent(parent, cursor):
+                crawl_poems(frontier.claim(cursor, ['poem'], shard=shard, parent=parent.url), cursor)
+        poems = frontier.claim(cursor, ['poem'], CRAWL_BATCH, shard, parent_kinds=kinds, parents=urls)
+        crawl_poems(poems, cursor)
+        commit(cursor)
+        frontier.finish_parents(cursor)
+        if parents or poems:
+            continue
+        wait = frontier.wait_time(cursor, kinds, shard, urls)
+        if wait is None:
+            break
+        log.info(f'↻ waiting {wait:.0f}s for failed pages to retry', extra={'wait': wait})
+        time.sleep(wait)
+    for kind, state, entries, retries in frontier.status(cursor):
+        log.info(f'⚙ frontier {kind} {state} {entries} [{retries} retries]',
+                 extra={'kind': kind, 'state': state, 'entries': entries})
+
+
+def expand_parent(parent, cursor):
+    """
+    Fetches a claimed poet or collection page and adds its new poem urls to the
+    frontier. Returns False if the page could not be fetched
+    """
+    if parent.kind == 'poet':
+        clean_poet_name(parent.name)
+    soup = poem_page_from(parent.url)
+    if not soup:
+        log.warning(f"{parent.kind.capitalize()} not found", extra={'url': parent.url, 'retries': parent.retries})
+        frontier.fail(cursor, parent.url, 'page not found')
+        return False
+    poem_links = find_poem_links(soup)
+    if not poem_links:
+        log.warning("No poems found", extra={'url': parent.url})
+    urls = new_poem_urls(poem_links, cursor, parent.tags)
+    with record(cursor):
+        if parent.kind == 'poet':
+            # todo: could also add in region
+            create_poet(parent.name, find_poet_years(soup), cursor)
+        frontier.add(cursor, 'poem', urls, tags=parent.tags, parent=parent.url)
+        frontier.mark(cursor, parent.url, frontier.FETCHED)
+    return True
+
+
+def crawl_poems(entries, cursor):
+    """
+    Fetches, parses and writes claimed poem entries, marking each written or failed
+    """
+    by_url = {entry.url: entry for entry in entries}
+    for url, poem, author in pipeline.parsed_poems(list(by_url)):
+        entry = by_url[url]
+        if not poem:
+            frontier.fail(cursor, url, 'no poem parsed')
+            continue
+        frontier.mark(cursor, url, frontier.PARSED)
+        try:
+            with metrics.stage('write'):
+                if entry.parent_kind == 'poet':
+                    poet_id = create_poet(entry.parent_name, None, cursor)
+                else:
+                    poet_id = create_poet(author, None, cursor)
+                # a poem queued under its poet keeps the tags of collections that link to it too
+                tag_csv = ','.join(tags for tags in (entry.parent_tags, entry.tags) if tags) or None
+                write_poem(poem, poet_id, cursor, tag_csv)
+        except sqlite3.Error as err:
+            log.warning(f"✗ {poem.title} not written, error {err}", extra={'url': url})
+            frontier.fail(cursor, url, err)
+            continue
+        frontier.mark(cursor, url, frontier.WRITTEN)
 
 
 def poet_name_to_dashes(name):
@@ -129,7 +274,7 @@ def poet_name_to_dashes(name):
 def clean_poet_name(name):
     poet = name.rstrip('\n')
     poet_dashes = poet_name_to_dashes(poet)
-    print(f"{'=' * 80}\n\n☛ {poet_dashes}\n\n")
+    log.info(f"{'=' * 80}\n\n☛ {poet_dashes}\n\n", extra={'poet': poet_dashes})
     return poet_dashes
 
 
@@ -141,7 +286,7 @@ def add_poet_poems(poet_name, cursor):
     poet_soup = find_poet_page(clean_poet_name(poet_name))
 
     if not poet_soup:
-        print("Poet not found")
+        log.warning("Poet not found")
         return
 
     poet_years = find_poet_years(poet_soup)
@@ -151,15 +296,14 @@ def add_poet_poems(poet_name, cursor):
     poem_links = find_poem_links(poet_soup)
 
     if not poem_links:
-        print("No poems found")
+        log.warning("No poems found")
         return
 
-    for poem in poem_links:
-        url = poem.get('href')
-        soup = soup_for(url)
-        poem = find_poem(soup, url)
+    urls = new_poem_urls(poem_links, cursor)
+    for url, poem, _ in pipeline.parsed_poems(urls):
         if poem:
-            write_poem(poem, poet_id, cursor)
+            with metrics.stage('write'):
+                write_poem(poem, poet_id, cursor)
 
 
 def add_poem_collection(collection_id, tag_csv, cursor):
@@ -171,36 +315,65 @@ def add_poem_collection(collection_id, tag_csv, cursor):
     parsed = poem_page_from(url)
 
     if not parsed:
-        print("Collection not found")
+        log.warning("Collection not found", extra={'collection': collection_id})
         return
 
     poem_links = find_poem_links(parsed)
 
     if not poem_links:
-        print("No poems found")
+        log.warning("No poems found", extra={'collection': collection_id})
         return
 
-    for poem in poem_links:
-        poem_url = poem.get('href')
-        soup = soup_for(poem_url)
-        poem = find_poem(soup, poem_url)
-        poet_id = create_poet(_author_from(soup), None, cursor)
-
+    urls = new_poem_urls(poem_links, cursor, tag_csv)
+    for poem_url, poem, author in pipeline.parsed_poems(urls):
         if poem:
-            print("done")
-            write_poem(poem, poet_id, cursor, tag_csv)
+            log.debug("done")
+            with metrics.stage('write'):
+                poet_id = create_poet(author, None, cursor)
+                write_poem(poem, poet_id, cursor, tag_csv)
+
+
+def new_poem_urls(poem_links, cursor, tag_csv=None):
+    """
+    Returns the unique hrefs of poem_links that aren't stored yet. Stored poems get
+    the tags in tag_csv added instead of being fetched again
+    """
+    stored = load_poem_urls(cursor)
+    urls = []
+    for url in dict.fromkeys(link.get('href') for link in poem_links):
+        if url not in stored:
+            urls.append(url)
+        elif tag_csv:
+            with record(cursor):
+                tag_poem(cursor.execute(SELECT_POEM_ID_BY_URL, (url,)).fetchone()[0], tag_csv, cursor)
+    skipped = len(poem_links) - len(urls)
+    if skipped:
+        log.info(f"↛ {skipped} poems [stored]\n", extra={'skipped': skipped})
+    return urls
 
 
 def soup_for(poem_url):
-    try:
-        req = urllib.request.Request(poem_url, headers={'User-Agent': "Google Chrome"})
-        page = urllib.request.urlopen(req)
-        return BeautifulSoup(page.read(), "html.parser")
-    except urllib.error.HTTPError as err:
-        print("Page not found, error " + str(err))
-    except urllib.error.URLError as err:
-        print("Page not found, error " + str(err))
-    return None
+    return soup_from(fetch.fetch_page(poem_url))
+
+
+def soup_from(page):
+    """
+    Returns the parsed soup of the page body or None if there is no page
+    """
+    if page is None:
+        return None
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(page, PARSER)
+
+
+def set_parser(name):
+    """
+    Sets the BeautifulSoup tree builder used for every page, one of PARSERS
+    """
+    global PARSER
+    if name not in PARSERS:
+        raise ValueError(f"unknown parser {name}, expected one of {PARSERS}")
+    PARSER = name
 
 
 def _author_from(soup):
@@ -214,22 +387,24 @@ def find_poem(poem_soup, url):
         poem_title = poem_soup.find('h1')
         if poem_title:
             title = unescape_text(poem_title.text, left=True, right=True)
-            print("⇅ " + title)
+            log.info("⇅ " + title, extra={'url': url})
 
             lines = find_poem_lines(poem_soup)
-            translator = find_span_beginning_remove(poem_soup,
+            # one pass over the spans serves both the translator and source lookups
+            spans = poem_soup.find_all('span', {'class': ['c-txt_attribution', 'c-txt_note']})
+            translator = find_span_beginning_remove(spans,
                                                     'c-txt_attribution',
                                                     'translated by')
-            source = find_span_beginning_remove(poem_soup, 'c-txt_note', 'source:')
+            source = find_span_beginning_remove(spans, 'c-txt_note', 'source:')
             year = None
             if source:
                 year = find_poem_year(source)
             return Poem(title=title, lines=lines, translator=translator,
                         source=source, year=year, url=url)
     except urllib.error.HTTPError as err:
-        print("Poem not found, error " + str(err))
+        log.warning("Poem not found, error " + str(err), extra={'url': url})
     except urllib.error.URLError as err:
-        print("Poem not found, error " + str(err))
+        log.warning("Poem not found, error " + str(err), extra={'url': url})
     return None
 
 
@@ -253,19 +428,13 @@ def find_poet_page(poet):
 
 
 def poem_page_from(url):
-    print("⇅ " + url)
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': "Google Chrome"})
-        page = urllib.request.urlopen(req)
-        soup = BeautifulSoup(page.read(), "html.parser")
-
-        print("✓ " + url + '\n')
-        return soup
-    except urllib.error.HTTPError as err:
-        print("Page not found, error " + str(err))
-    except urllib.error.URLError as err:
-        print("Page not found, error " + str(err))
-    return None
+    log.info("⇅ " + url, extra={'url': url})
+    page = fetch.fetch_page(url)
+    with metrics.stage('parse'):
+        soup = soup_from(page)
+    if soup:
+        log.info("✓ " + url + '\n', extra={'url': url})
+    return soup
 
 
 def find_poem_links(soup):
@@ -297,9 +466,10 @@ def find_poem_lines(soup):
 
     lines = []
     for line in poemLines:
-        text = unescape_text(line.text, left=True)
+        # lxml turns \r\n and \r into \n as it parses, html.parser keeps them
+        text = unescape_text(line.text, left=True).replace('\r\n', '\n').replace('\r', '\n')
         cut = re.split(r'\n\r? ?', text)
-        lines = lines + cut
+        lines.extend(cut)
     return lines
 
 
@@ -318,9 +488,12 @@ def find_span_beginning_remove(soup, span_class, pattern):
 def find_span_element(soup, span_class, pattern):
     """
     Given a soup a span_class and a patter, finds all examples of span_class that
-    contain pattern and returns them
+    contain pattern and returns them. soup may also be a list of already found spans
     """
-    spans = soup.find_all('span', {'class': span_class})
+    if isinstance(soup, list):
+        spans = [span for span in soup if span_class in span.get('class', [])]
+    else:
+        spans = soup.find_all('span', {'class': span_class})
     for span in spans:
         text = unescape_text(span.text, left=True, right=True)
         if re.search(pattern, text, re.I | re.U):
@@ -341,118 +514,6 @@ def unescape_text(text, left=False, right=False):
     return text
 
 
-### Begin sql functions
-
-def create_tables(cursor):
-    """
-    Sets up the tables on cursor if they don't already exist
-    """
-    cursor.execute(CREATE_POETS)
-    cursor.execute(CREATE_POEMS)
-    cursor.execute(CREATE_LINES)
-    cursor.execute(CREATE_TAGS)
-
-
-def drop_tables(cursor):
-    for table in ['POETS', 'POEMS', 'LINES', 'TAGS']:
-        cursor.execute(f'DROP TABLE IF EXISTS {table}')
-
-
-def write_poem(poem, poet_id, cursor, tag_csv=None):
-    res = poem_exists(poem.title, poet_id, cursor)
-    if res:
-        print(f"↛ {poem.title} [exists]\n")
-        return
-    poem_id = create_poem(poem, poet_id, cursor)
-    for lid in range(len(poem.lines)):
-        line = poem.lines[lid]
-        add_line(lid, poem_id, line, cursor)
-
-    if tag_csv:
-        tags = filter(None, [f'"{x.strip()}"' for x in tag_csv.split(',')])
-        for name in tags:
-            add_tag(poem_id, name, cursor)
-    print(f'✓ {poem.title}\n')
-
-
-def poet_exists(poet_name, cursor):
-    """
-    Returns true if poet_name exists in cursor
-    """
-    return cursor.execute(SELECT_POET_EXISTS, (poet_name,)).fetchall()
-
-
-def create_poet(poet_name, years, cursor):
-    """
-    Creates poet_name with years in cursor if not exists
-    """
-    if not poet_exists(poet_name, cursor):
-        if years:
-            born = years[0]
-            if len(years) > 1:
-                died = years[1]
-                cursor.execute(INSERT_POET_DEAD, (poet_name, born, died))
-            else:
-                cursor.execute(INSERT_POET_ALIVE, (poet_name, born))
-        else:
-            cursor.execute(INSERT_POET, (poet_name,))
-    return cursor.execute(SELECT_POET_ID, (poet_name,)).fetchone()[0]
-
-
-def create_poem(poem, poet_id, cursor):
-    """
-    Creates an entry for poem of poet_id in cursor
-    """
-    query_names = ""
-    query_values = ""
-    num_lines = len(poem.lines)
-    params = (poem.title, poet_id, num_lines)
-
-    # TODO: this can be factored out
-    if poem.url:
-        query_names = query_names + ", url"
-        query_values = query_values + ", ?"
-        params = params + (poem.url,)
-    if poem.source:
-        query_names = query_names + ", source"
-        query_values = query_values + ", ?"
-        params = params + (poem.source,)
-    if poem.year:
-        query_names = query_names + ", year"
-        query_values = query_values + ", ?"
-        params = params + (poem.year,)
-    if poem.translator:
-        query_names = query_names + ", translator"
-        query_values = query_values + ", ?"
-        params = params + (poem.translator,)
-
-    query = INSERT_POEM % (query_names, query_values)
-    cursor.execute(query, params)
-
-    return cursor.execute(SELECT_POEM_ID, (poem.title, poet_id)).fetchone()[0]
-
-
-def poem_exists(poem_name, poet_id, cursor):
-    """
-    Returns True if poem_name and poet_id exist in cursor
-    """
-    return cursor.execute(SELECT_POEM_EXISTS, (poem_name, poet_id)).fetchall()
-
-
-def add_line(lid, poem_id, line, cursor):
-    """
-    Adds line with id lid pid and value line to cursor
-    """
-    cursor.execute(INSERT_LINE, (lid, poem_id, line))
-
-
-def add_tag(poem_id, tag_name, cursor):
-    """
-    Adds tag to a poem
-    """
-    cursor.execute(INSERT_TAG, (poem_id, tag_name))
-
-
 def _debug_single(url):
     soup = soup_for(url)
     poem = find_poem(soup, url)
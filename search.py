@@ -0,0 +1,122 @@
+"""
+Ranked full text search over the poems and songs databases
+"""
+
+from __future__ import print_function
+
+import argparse
+import sqlite3
+
+from sql_util import DATABASE, check_schema, connect_readonly
+
+SONGS_DATABASE = "songs.db"
+LIMIT = 10
+SNIPPET_TOKENS = 12
+
+# bm25 weights per column, a title hit counts for more than a hit in the text
+SEARCH_POEMS = f"""
+SELECT F.rowid, F.poem_name, PT.poet_name,
+       snippet(POEMS_FTS, 1, '[', ']', '…', {SNIPPET_TOKENS}),
+       bm25(POEMS_FTS, 5.0, 1.0) AS score
+FROM POEMS_FTS AS F
+         JOIN POEMS AS PM ON PM.pid = F.rowid
+         JOIN POETS AS PT ON PT.pid = PM.poet_id
+WHERE POEMS_FTS MATCH ?
+ORDER BY score
+LIMIT ?;
+"""
+
+SEARCH_SONGS = f"""
+SELECT S.id, S.name, S.artist,
+       snippet(SONGS_FTS, 1, '[', ']', '…', {SNIPPET_TOKENS}),
+       bm25(SONGS_FTS, 5.0, 1.0) AS score
+FROM SONGS_FTS AS F
+         JOIN songs AS S ON S.id = F.rowid
+WHERE SONGS_FTS MATCH ?
+ORDER BY score
+LIMIT ?;
+"""
+
+
+class Hit(object):
+    """
+    A search result, lower score ranks higher
+    """
+
+    def __init__(self, id, title, author, snippet, score):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.snippet = snippet
+        self.score = score
+
+    def __repr__(self):
+        return f"Hit({self.id}, {self.title!r}, {self.score:.2f})"
+
+
+def search_poems(cursor, query, limit=LIMIT):
+    """
+    Returns the best matching poems for an FTS5 query as Hits
+    """
+    return _search(cursor, SEARCH_POEMS, query, limit)
+
+
+def search_songs(cursor, query, limit=LIMIT):
+    """
+    Returns the best matching songs for an FTS5 query as Hits
+    """
+    return _search(cursor, SEARCH_SONGS, query, limit)
+
+
+def _search(cursor, statement, query, limit):
+    try:
+        rows = cursor.execute(statement, (query, limit)).fetchall()
+    except sqlite3.OperationalError as err:
+        if 'fts5' not in str(err):
+            raise
+        # not valid FTS5 syntax, search for the words as a phrase instead
+        rows = cursor.execute(statement, (_phrase(query), limit)).fetchall()
+    return [Hit(*row) for row in rows]
+
+
+def _phrase(query):
+    return '"' + query.replace('"', '""') + '"'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", type=str, help="FTS5 query, e.g. 'sea NEAR/5 light' or 'moon*'")
+    parser.add_argument("--songs", action="store_true", help="search songs instead of poems")
+    parser.add_argument("-d", "--database", type=str, help="database to search")
+    parser.add_argument("-n", "--limit", type=int, default=LIMIT, help="number of hits")
+
+    args = parser.parse_args()
+    database = args.database or (SONGS_DATABASE if args.songs else DATABASE)
+    try:
+        conn = connect_readonly(database)
+    except sqlite3.OperationalError as err:
+        parser.error(f"can't open {database}: {err}")
+    cursor = conn.cursor()
+    if args.songs:
+        if not cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'SONGS_FTS';").fetchone():
+            parser.exit(1, f'{database} has no search index, run `python dedup.py --songs -d {database}` '
+                           f'to build it\n')
+        hits = search_songs(cursor, args.query, args.limit)
+    else:
+        try:
+            check_schema(cursor)
+        except sqlite3.DatabaseError as err:
+            parser.exit(1, f'{err}\n')
+        hits = search_poems(cursor, args.query, args.limit)
+
+    if not hits:
+        print("no matches")
+    for hit in hits:
+        snippet = ' / '.join(line.strip() for line in hit.snippet.split('\n') if line.strip())
+        print(f"{hit.id:>6}  {hit.title} ({(hit.author or '').strip()})\n        {snippet}")
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
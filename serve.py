@@ -0,0 +1,312 @@
+"""
+Long-running random poem service. The poems with lines are loaded once into
+memory as ready-made JSON, indexed per author and ordered by length, so picking a
+random poem is a bisect and a random index. The corpus is reloaded in the
+background when the database changes. Serves HTTP on a port or a Unix socket:
+
+    GET /poem/random?author=&max_lines=&line_length=
+    GET /poem/<id>
+    GET /health
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import json
+import os
+import random
+import socketserver
+import sqlite3
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import logs
+from read import LINE_LENGTH, MAX_LINES
+from sql_util import DATABASE, check_schema, connect_readonly
+
+# poems are served once they have a POEM_STATS row. store.write_poem adds it in the
+# same record as the poem's lines, and sql_util.py fills it for older poems, so any
+# other writer of POEMS and LINES has to add it too for its poems to be served
+SELECT_CORPUS = """
+SELECT PM.pid, PM.poem_name, PT.poet_name, PM.translator, PM.year, PM.source, PM.url, S.num_lines, S.num_chars,
+       (SELECT group_concat(poem_line, char(10))
+        FROM (SELECT poem_line FROM LINES WHERE LINES.pid = PM.pid ORDER BY lid))
+FROM POEMS AS PM
+         JOIN POETS AS PT ON PT.pid = PM.poet_id
+         JOIN POEM_STATS AS S ON S.pid = PM.pid
+ORDER BY S.num_lines, PM.pid;
+"""
+
+# seconds between checks of the database for changes
+RELOAD_EVERY = 2.0
+# filtered id arrays kept for character limits tighter than the line limit implies
+FILTER_CACHE_SIZE = 256
+
+log = logs.get('serve')
+
+
+class _Index(object):
+    """
+    Pids of a set of poems ordered by line count, with their line and character
+    counts and the running maximum character count
+    """
+
+    __slots__ = ('pids', 'lines', 'chars', 'max_chars')
+
+    def __init__(self):
+        self.pids = array('q')
+        self.lines = array('q')
+        self.chars = array('q')
+        self.max_chars = array('q')
+
+    def add(self, pid, num_lines, num_chars):
+        self.pids.append(pid)
+        self.lines.append(num_lines)
+        self.chars.append(num_chars)
+        self.max_chars.append(max(num_chars, self.max_chars[-1] if self.max_chars else 0))
+
+
+class Corpus(object):
+    """
+    The poems of a database as JSON bodies by pid, with a length ordered index of
+    every poem and of each author's poems
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self.bodies = {}
+        self.everyone = _Index()
+        self.authors = {}
+        self._filtered = {}
+        self._lock = threading.Lock()
+        self.loaded_at = time.time()
+        conn = connect_readonly(database)
+        try:
+            for row in conn.execute(SELECT_CORPUS):
+                self._add(*row)
+        finally:
+            conn.close()
+
+    def _add(self, pid, title, author, translator, year, source, url, num_lines, num_chars, text):
+        # batch runs stored poet names with the newline of their poets.txt line
+        author = author.strip() if author else author
+        self.bodies[pid] = json.dumps({
+            'id': pid, 'title': title, 'author': author, 'translator': translator, 'year': year,
+            'source': source, 'url': url, 'lines': text.split('\n') if text is not None else [],
+        }).encode('utf-8')
+        self.everyone.add(pid, num_lines, num_chars)
+        if author not in self.authors:
+            self.authors[author] = _Index()
+        self.authors[author].add(pid, num_lines, num_chars)
+
+    def __len__(self):
+        return len(self.bodies)
+
+    def eligible(self, author=None, max_lines=MAX_LINES, max_characters=MAX_LINES * LINE_LENGTH):
+        """
+        Returns (pids, count): the first count of pids are the poems by author (any if
+        None) within max_lines and max_characters
+        """
+        index = self.everyone if author is None else self.authors.get(author.strip())
+        if index is None:
+            return index, 0
+        count = bisect.bisect_right(index.lines, max_lines)
+        if not count or index.max_chars[count - 1] <= max_characters:
+            return index.pids, count
+        key = (author, max_lines, max_characters)
+        with self._lock:
+            pids = self._filtered.get(key)
+            if pids is None:
+                pids = array('q', (pid for pid, chars in zip(index.pids[:count], index.chars[:count])
+                                   if chars <= max_characters))
+                if len(self._filtered) >= FILTER_CACHE_SIZE:
+                    self._filtered.clear()
+                self._filtered[key] = pids
+        return pids, len(pids)
+
+    def random_poem(self, author=None, max_lines=MAX_LINES, line_length=LINE_LENGTH):
+        """
+        Returns the JSON body of a random poem like read.get_random_poem picks, or
+        None if none match
+        """
+        pids, count = self.eligible(author, max_lines, max_lines * line_length)
+        if not count:
+            return None
+        return self.bodies[pids[random.randrange(count)]]
+
+    def poem(self, pid):
+        return self.bodies.get(pid)
+
+
+class PoemService(object):
+    """
+    Holds the current Corpus of a database and swaps in a new one when the
+    database changes
+    """
+
+    def __init__(self, database, reload_every=RELOAD_EVERY):
+        self.database = database
+        self.reload_every = reload_every
+        # the service only reads, migrating the database it serves is left to sql_util.py.
+        # data_version changes whenever another connection commits to the database
+        self._watch = connect_readonly(database, check_same_thread=False)
+        try:
+            check_schema(self._watch.cursor())
+        except sqlite3.DatabaseError:
+            self._watch.close()
+            raise
+        self._version = self._data_version()
+        self.corpus = self._load()
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch_database, daemon=True)
+
+    def _data_version(self):
+        return self._watch.execute("PRAGMA data_version;").fetchone()[0]
+
+    def _load(self):
+        start = time.perf_counter()
+        corpus = Corpus(self.database)
+        log.info(f'⇪ loaded {len(corpus)} poems in {time.perf_counter() - start:.2f}s',
+                 extra={'poems': len(corpus)})
+        return corpus
+
+    def reload_if_changed(self):
+        """
+        Loads a fresh corpus if the database changed since the last check. Returns
+        True if it did
+        """
+        version = self._data_version()
+        if version == self._version:
+            return False
+        self._version = version
+        # requests keep using the old corpus until the new one is fully loaded
+        self.corpus = self._load()
+        self.reloads += 1
+        return True
+
+    def _watch_database(self):
+        while not self._stop.wait(self.reload_every):
+            try:
+                self.reload_if_changed()
+            except sqlite3.Error as err:
+                log.warning(f'reload failed, error {err}')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._watch.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        corpus = self.server.service.corpus
+        if url.path == '/poem/random':
+            query = parse_qs(url.query)
+            try:
+                max_lines = int(query.get('max_lines', [MAX_LINES])[0])
+                line_length = int(query.get('line_length', [LINE_LENGTH])[0])
+            except ValueError:
+                return self._send(400, {'error': 'max_lines and line_length must be integers'})
+            body = corpus.random_poem(query.get('author', [None])[0], max_lines, line_length)
+            return self._send(200, body) if body else self._send(404, {'error': 'no poem found'})
+        if url.path.startswith('/poem/'):
+            try:
+                body = corpus.poem(int(url.path[len('/poem/'):]))
+            except ValueError:
+                body = None
+            return self._send(200, body) if body else self._send(404, {'error': 'no such poem'})
+        if url.path == '/health':
+            return self._send(200, {'poems': len(corpus), 'authors': len(corpus.authors),
+                                    'loaded_at': corpus.loaded_at, 'reloads': self.server.service.reloads})
+        self._send(404, {'error': 'not found'})
+
+    def _send(self, status, body):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _UnixHandler(_Handler):
+    # Unix sockets have no Nagle algorithm to turn off
+    disable_nagle_algorithm = False
+
+    def address_string(self):
+        return 'unix'
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = self.server_address
+        self.server_port = 0
+
+
+def make_server(service, host='127.0.0.1', port=8080, unix_socket=None):
+    """
+    Returns an HTTP server for service on host and port, or on unix_socket if given
+    """
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, _UnixHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=DATABASE, help="poems database to serve")
+    parser.add_argument("--host", type=str, default='127.0.0.1', help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--socket", type=str, help="listen on this Unix socket instead of a port")
+    parser.add_argument("--reload_every", type=float, default=RELOAD_EVERY,
+                        help="seconds between checks of the database for changes")
+    logs.add_log_arguments(parser)
+
+    args = parser.parse_args()
+    logs.configure_from_args(args)
+    try:
+        service = PoemService(args.database, args.reload_every)
+    except sqlite3.OperationalError as err:
+        parser.error(f"can't open {args.database}: {err}")
+    except sqlite3.DatabaseError as err:
+        parser.exit(1, f'{err}\n')
+    server = make_server(service, args.host, args.port, args.socket)
+    service.start()
+    log.info(f'serving {args.database} on {args.socket or f"http://{args.host}:{server.server_address[1]}"}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,366 @@
+"""
+Compact binary snapshot of a poem or song corpus. All line text lives in one
+UTF-8 blob with every line followed by a newline, so a poem's full text and each
+of its lines are plain slices of it. Titles, poets, tags and the other string
+fields are interned into a second blob. The loader memory-maps the file and
+slices both blobs through the offset arrays without copying
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+from array import array
+
+from poem import Poem
+from sql_util import DATABASE
+
+MAGIC = b'POESNAP\0'
+VERSION = 2
+
+# magic, version, section count, then per section: name, offset, byte length
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<16sQQ')
+
+# section name -> array typecode, 'B' for raw bytes
+SECTIONS = [
+    ('text', 'B'),
+    ('strings', 'B'),
+    ('line_offsets', 'Q'),
+    ('string_offsets', 'Q'),
+    ('poem_ids', 'q'),
+    ('poem_lines', 'Q'),
+    ('poem_title', 'I'),
+    ('poem_author', 'I'),
+    ('poem_url', 'I'),
+    ('poem_translator', 'I'),
+    ('poem_source', 'I'),
+    ('poem_year', 'i'),
+    ('poem_tag_starts', 'Q'),
+    ('poem_tags', 'I'),
+]
+STRING_COLUMNS = ['title', 'author', 'url', 'translator', 'source']
+
+SELECT_SNAPSHOT_POEMS = """
+SELECT PM.pid, PM.poem_name, PT.poet_name, PM.url, PM.translator, PM.source, PM.year
+FROM POEMS AS PM
+         JOIN POETS AS PT ON PT.PID = PM.poet_id
+ORDER BY PM.pid;
+"""
+SELECT_SNAPSHOT_LINES = """SELECT pid, poem_line FROM LINES ORDER BY pid, lid;"""
+SELECT_SNAPSHOT_TAGS = """SELECT pid, name FROM TAGS ORDER BY pid, tid;"""
+SELECT_SNAPSHOT_SONGS = """SELECT id, name, artist, url, NULL, type, year, lyrics FROM songs ORDER BY id;"""
+
+
+class SnapshotWriter(object):
+    """
+    Streams records into a snapshot file. Line text goes straight to a temporary
+    file, so memory only holds the offset arrays and the interned strings
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._text = tempfile.TemporaryFile()
+        self._text_size = 0
+        self._strings = {'': 0}
+        self._string_blob = bytearray()
+        self._string_offsets = array('Q', [0, 0])
+        self._columns = {name: array(code) for name, code in SECTIONS if name.startswith('poem_')}
+        self._line_offsets = array('Q', [0])
+        self._columns['poem_lines'].append(0)
+        self._columns['poem_tag_starts'].append(0)
+
+    def add(self, id, title, lines, author=None, url=None, translator=None, source=None, year=None, tags=()):
+        """
+        Appends one record, ids must be added in increasing order
+        """
+        for line in lines:
+            data = (line or '').encode('utf-8') + b'\n'
+            self._text.write(data)
+            self._text_size += len(data)
+            self._line_offsets.append(self._text_size)
+        columns = self._columns
+        columns['poem_ids'].append(id)
+        columns['poem_lines'].append(len(self._line_offsets) - 1)
+        values = {'title': title, 'author': author, 'url': url, 'translator': translator, 'source': source}
+        for name in STRING_COLUMNS:
+            columns['poem_' + name].append(self._intern(values[name]))
+        columns['poem_year'].append(_year(year))
+        columns['poem_tags'].extend(self._intern(tag) for tag in tags)
+        columns['poem_tag_starts'].append(len(columns['poem_tags']))
+
+    def close(self):
+        """
+        Writes the snapshot file and returns the number of records in it
+        """
+        sections = {
+            'line_offsets': self._line_offsets,
+            'string_offsets': self._string_offsets,
+            'strings': bytes(self._string_blob),
+        }
+        sections.update(self._columns)
+        table_size = HEADER.size + SECTION.size * len(SECTIONS)
+        entries = []
+        with open(self.path, 'wb') as out:
+            out.write(b'\0' * table_size)
+            for name, _ in SECTIONS:
+                _pad(out)
+                offset = out.tell()
+                if name == 'text':
+                    self._text.seek(0)
+                    while True:
+                        chunk = self._text.read(1024 * 1024)
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                else:
+                    data = sections[name]
+                    out.write(data if isinstance(data, bytes) else data.tobytes())
+                entries.append((name, offset, out.tell() - offset))
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+            for name, offset, length in entries:
+                out.write(SECTION.pack(name.encode('ascii'), offset, length))
+        self._text.close()
+        return len(self._columns['poem_ids'])
+
+    def _intern(self, value):
+        if value is None:
+            return 0
+        value = str(value)
+        index = self._strings.get(value)
+        if index is None:
+            index = len(self._string_offsets) - 1
+            self._strings[value] = index
+            self._string_blob += value.encode('utf-8')
+            self._string_offsets.append(len(self._string_blob))
+        return index
+
+
+class Snapshot(object):
+    """
+    A memory-mapped snapshot. Records are addressed by position; by_id maps a
+    database id to its position
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} snapshot')
+        codes = dict(SECTIONS)
+        self._sections = {}
+        for index in range(count):
+            raw_name, offset, length = SECTION.unpack_from(self._map, HEADER.size + index * SECTION.size)
+            name = raw_name.rstrip(b'\0').decode('ascii')
+            section = view[offset:offset + length]
+            self._sections[name] = section if codes[name] == 'B' else section.cast(codes[name])
+        self.text = self._sections['text']
+        self.strings = self._sections['strings']
+        self.ids = self._sections['poem_ids']
+        self._line_offsets = self._sections['line_offsets']
+        self._string_offsets = self._sections['string_offsets']
+        self._poem_lines = self._sections['poem_lines']
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def num_lines(self):
+        return len(self._line_offsets) - 1
+
+    def by_id(self, id):
+        """
+        Returns the position of the record with database id, or None
+        """
+        index = bisect.bisect_left(self.ids, id)
+        if index < len(self.ids) and self.ids[index] == id:
+            return index
+        return None
+
+    def line_bytes(self, line):
+        """
+        Returns a zero-copy view of the UTF-8 bytes of a line by global line index
+        """
+        return self.text[self._line_offsets[line]:self._line_offsets[line + 1] - 1]
+
+    def line(self, line):
+        return str(self.line_bytes(line), 'utf-8')
+
+    def line_range(self, index):
+        """
+        Returns the global (start, end) line indexes of the record at index
+        """
+        return self._poem_lines[index], self._poem_lines[index + 1]
+
+    def text_bytes(self, index):
+        """
+        Returns a zero-copy view of the newline joined text of the record at index
+        """
+        start, end = self.line_range(index)
+        if start == end:
+            return self.text[0:0]
+        return self.text[self._line_offsets[start]:self._line_offsets[end] - 1]
+
+    def full_text(self, index):
+        return str(self.text_bytes(index), 'utf-8')
+
+    def lines(self, index):
+        start, end = self.line_range(index)
+        return [self.line(line) for line in range(start, end)]
+
+    def string(self, string_id):
+        """
+        Returns an interned string by id, None for the empty string
+        """
+        if not string_id:
+            return None
+        return str(self.strings[self._string_offsets[string_id]:self._string_offsets[string_id + 1]], 'utf-8')
+
+    def field(self, index, name):
+        """
+        Returns one of the STRING_COLUMNS of the record at index
+        """
+        return self.string(self._sections['poem_' + name][index])
+
+    def year(self, index):
+        """
+        Returns the year of the record at index as an int, or None
+        """
+        return self._sections['poem_year'][index] or None
+
+    def tags(self, index):
+        starts = self._sections['poem_tag_starts']
+        tags = self._sections['poem_tags']
+        return [self.string(tags[i]) for i in range(starts[index], starts[index + 1])]
+
+    def poem(self, index):
+        """
+        Returns the record at index as a Poem
+        """
+        fields = {name: self.field(index, name) for name in STRING_COLUMNS}
+        return Poem(id=self.ids[index], text=self.full_text(index), year=self.year(index), **fields)
+
+    def poems(self, with_lines_only=True):
+        """
+        Yields every record as a Poem, skipping records without lines unless told otherwise
+        """
+        for index in range(len(self)):
+            start, end = self.line_range(index)
+            if start != end or not with_lines_only:
+                yield self.poem(index)
+
+    def close(self):
+        """
+        Releases the section views and closes the file. Views handed out by
+        line_bytes and text_bytes that are still alive keep the mapping open until
+        they are garbage collected
+        """
+        for name in list(self._sections):
+            self._sections[name].release()
+        self._sections.clear()
+        self.text = self.strings = self.ids = None
+        self._line_offsets = self._string_offsets = self._poem_lines = None
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+        self._map = None
+        self._file.close()
+
+
+def load(path):
+    return Snapshot(path)
+
+
+def _year(value):
+    """
+    Returns a year column value: an int year as it is, the first four digit year in
+    text like the '(1992)' poems keep, 0 for none
+    """
+    if isinstance(value, int):
+        return value
+    match = re.search(r'\d{4}', value or '')
+    return int(match.group(0)) if match else 0
+
+
+def _pad(out, alignment=8):
+    remainder = out.tell() % alignment
+    if remainder:
+        out.write(b'\0' * (alignment - remainder))
+
+
+def write_poems_snapshot(database, path):
+    """
+    Writes every poem in database with its lines and tags to a snapshot at path
+    """
+    conn = sqlite3.connect(database)
+    lines = conn.execute(SELECT_SNAPSHOT_LINES)
+    tags = conn.cursor().execute(SELECT_SNAPSHOT_TAGS)
+    next_line = lines.fetchone()
+    next_tag = tags.fetchone()
+    writer = SnapshotWriter(path)
+    for pid, title, author, url, translator, source, year in conn.cursor().execute(SELECT_SNAPSHOT_POEMS):
+        # LINES and TAGS are walked alongside POEMS in pid order
+        poem_lines = []
+        while next_line and next_line[0] <= pid:
+            if next_line[0] == pid:
+                poem_lines.append(next_line[1])
+            next_line = lines.fetchone()
+        poem_tags = []
+        while next_tag and next_tag[0] <= pid:
+            if next_tag[0] == pid:
+                poem_tags.append(next_tag[1])
+            next_tag = tags.fetchone()
+        writer.add(pid, title, poem_lines, author=author, url=url, translator=translator,
+                   source=source, year=year, tags=poem_tags)
+    conn.close()
+    return writer.close()
+
+
+def write_songs_snapshot(database, path):
+    """
+    Writes every song in database to a snapshot at path, with the album type as source
+    """
+    conn = sqlite3.connect(database)
+    writer = SnapshotWriter(path)
+    for id, name, artist, url, translator, source, year, lyrics in conn.execute(SELECT_SNAPSHOT_SONGS):
+        writer.add(id, name, (lyrics or '').split('\n'), author=artist, url=url, source=source, year=year)
+    conn.close()
+    return writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, default=DATABASE, help="database to snapshot")
+    parser.add_argument("-o", "--out", type=str, help="snapshot file to write")
+    parser.add_argument("--songs", action="store_true", help="database is a songs.db")
+    parser.add_argument("--info", type=str, help="print the size of an existing snapshot")
+
+    args = parser.parse_args()
+    if args.info:
+        snap = load(args.info)
+        print(f'{args.info}: {len(snap)} records, {snap.num_lines} lines, '
+              f'{os.path.getsize(args.info) / 1024 / 1024:.1f}MB')
+        snap.close()
+        return
+
+    out = args.out or os.path.splitext(args.database)[0] + '.snap'
+    if args.songs:
+        count = write_songs_snapshot(args.database, out)
+    else:
+        count = write_poems_snapshot(args.database, out)
+    print(f'✍︎ wrote {count} records to {out}')
+
+
+if __name__ == '__main__':
+    main()
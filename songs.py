@@ -1,11 +1,10 @@
 import random
 import re
-import time
 import urllib.error
-import urllib.parse
-import urllib.request
 
-from bs4 import BeautifulSoup
+import logs
+import metrics
+from poem import intern_author
 
 USER_AGENTS = [
     'Mozilla/5.0 (Windows; U; Windows NT 5.1; it; rv:1.8.1.11) Gecko/20071127 Firefox/2.0.0.11',
@@ -17,20 +16,32 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:53.0) Gecko/20100101 Firefox/53.0',
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36']
 
+log = logs.get('songs')
+
+
+def soup_from(page):
+    """
+    Returns the parsed soup of a page. bs4 and lxml, like http_session, are only
+    loaded once a page is fetched or parsed, so runs that only read songs.db skip them
+    """
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(page, 'lxml')
+
 
 class MakeRequest:
+    __slots__ = ()
     baseURL = 'http://www.azlyrics.com/'
 
     def get(self, url):
-        req = urllib.request.Request(url, headers={'User-Agent': random.choice(USER_AGENTS)})
+        import http_session
         try:
-            return urllib.request.urlopen(req)
+            return http_session.get(url, {'User-Agent': random.choice(USER_AGENTS)})
         except urllib.error.HTTPError as err:
-            print("page not found, error " + str(err))
+            log.warning("page not found, error " + str(err), extra={'url': url, 'status': err.code})
         except urllib.error.URLError as err:
-            print("page not found, error " + str(err))
+            log.warning("page not found, error " + str(err), extra={'url': url})
         except Exception as err:
-            print("generic error " + str(err))
+            log.error("generic error " + str(err), extra={'url': url})
 
 
 class Artist(MakeRequest):
@@ -38,24 +49,38 @@ class Artist(MakeRequest):
         super().__init__()
         self.artist_name = artist_name
         self.song_page_name = song_page_name
+        self._song_list_soup = None
+        self._album_song_lists = None
 
     def get_song_page_name(self):
         return self.song_page_name or self.artist_name
 
+    def get_song_list_url(self):
+        return self.baseURL + self.artist_name[0] + '/' + self.artist_name + '.html'
+
     def get_song_list_page(self):
-        url = self.baseURL + self.artist_name[0] + '/' + self.artist_name + '.html'
-        response = self.get(url)
+        response = self.get(self.get_song_list_url())
         return response
 
+    def get_song_list_soup(self):
+        """
+        Returns the parsed artist index page, fetched and parsed once per artist
+        """
+        if self._song_list_soup is None:
+            page = self.get_song_list_page().read()
+            with metrics.stage('parse'):
+                self._song_list_soup = soup_from(page)
+        return self._song_list_soup
+
     def get_song_list(self):
-        soup = BeautifulSoup(self.get_song_list_page().read(), 'lxml')
+        soup = self.get_song_list_soup()
         songs = []
         for song in soup.find_all(target='_blank'):
             songs.append(str(song.text))
         return songs
 
     def get_album_infos(self):
-        soup = BeautifulSoup(self.get_song_list_page().read(), 'lxml')
+        soup = self.get_song_list_soup()
         album_infos = []
         for album in soup.find_all("div", {"class": "album"}):
             album_info = self.parse_album_info(album.text)
@@ -75,55 +100,74 @@ class Artist(MakeRequest):
         album_info['title'] = title
         return album_info
 
+    def get_album_song_lists(self):
+        """
+        Returns a dict from each album's raw header text to its song names, built in
+        one pass over the album list of the index page
+        """
+        if self._album_song_lists is None:
+            song_lists = {}
+            albums = self.get_song_list_soup().find_all("div", {"id": "listAlbum"})
+            current = None
+            for child in albums[0].find_all(['a', 'div'], recursive=False):
+                if child.name == 'div':
+                    current = song_lists.setdefault(child.text, [])
+                elif current is not None and child.has_attr('target'):
+                    current.append(child.text)
+            self._album_song_lists = song_lists
+        return self._album_song_lists
+
+    def get_albums(self):
+        """
+        Returns every Album of the artist with its songs, all from a single index page fetch
+        """
+        song_lists = self.get_album_song_lists()
+        return [Album(self.artist_name, album_info, song_lists.get(album_info['raw'], []))
+                for album_info in self.get_album_infos()]
+
 
 class Album(Artist):
-    def __init__(self, artist_name, album_info):
+    def __init__(self, artist_name, album_info, songs=None):
         super(Album, self).__init__(artist_name)
         self.album_info = album_info
         self.title = self.album_info['title']
         self.type = self.album_info['type']
         self.year = self.album_info['year']
         self.artist_name = artist_name
-        self.songs = self.get_album_songs()
-
+        self.songs = self.get_album_songs() if songs is None else songs
 
     def get_album_songs(self):
-        songs = []
-        soup = BeautifulSoup(self.get_song_list_page().read(), 'lxml')
-        albums = soup.find_all("div", {"id": "listAlbum"})
-        children = albums[0].find_all(['a', 'div'], recursive=False)
-        current = None
-        for child in children:
-            if child.text == self.album_info['raw']:
-                current = True
-            elif current:
-                if child.name != 'div':
-                    if child.has_attr('target'):
-                        songs.append(child.text)
-                else:
-                    break
-
-        return songs
+        return list(self.get_album_song_lists().get(self.album_info['raw'], []))
 
     def __repr__(self):
         return "Album: {0} from year {1} of type {2}".format(self.title, self.year, self.type)
 
 
 class Song(MakeRequest):
+    """
+    A song's lyrics are kept once, lines are split from them when asked for as a
+    tuple
+    """
+
+    __slots__ = ('song_name', 'artist_name', 'lyrics')
 
     def __init__(self, artist_name, song_name, lyrics=None):
         super().__init__()
         self.song_name = song_name
-        self.artist_name = artist_name
-        self.lines = lyrics.split('\n') if lyrics else self.get_lines()
-        self.lyrics = '\n'.join(self.lines)
+        self.artist_name = intern_author(artist_name)
+        self.lyrics = lyrics if lyrics else '\n'.join(self.get_lines())
+
+    @property
+    def lines(self):
+        return tuple(self.lyrics.split('\n'))
 
     def get_lines(self):
-        time.sleep(10)
-        print(f' ⇅ {self.song_name}')
-        soup = BeautifulSoup(self.get_song_page(), 'lxml')
-        page_lyric = soup.find_all("div", limit=22)[-1]  # lyrics start on 22nd div
-        return [s.strip() for s in page_lyric.find_all(text=True)[2:]]
+        log.info(f' ⇅ {self.song_name}', extra={'song': self.song_name})
+        page = self.get_song_page()
+        with metrics.stage('parse'):
+            soup = soup_from(page)
+            page_lyric = soup.find_all("div", limit=22)[-1]  # lyrics start on 22nd div
+            return [s.strip() for s in page_lyric.find_all(text=True)[2:]]
 
     def get_song_url(self):
         song_url = re.sub(r'[^\w\s]', '', self.song_name).replace(" ", '').lower()
@@ -1,3 +1,16 @@
+"""
+Schema, migration and transaction helpers shared by the scrapers
+"""
+
+from __future__ import print_function
+
+import argparse
+import contextlib
+import pathlib
+import sqlite3
+
+import logs
+
 DATABASE = "poems.db"
 
 CREATE_POETS = """
@@ -35,3 +48,285 @@ CREATE TABLE IF NOT EXISTS TAGS
        name VARCHAR(256),
        UNIQUE(tid, pid));
 """
+
+CREATE_POEM_STATS = """
+CREATE TABLE IF NOT EXISTS POEM_STATS
+       (pid INTEGER PRIMARY KEY REFERENCES POEMS(pid),
+       poet_id INTEGER REFERENCES POETS(pid),
+       num_lines INTEGER,
+       num_chars INTEGER);
+"""
+
+# full text index of each poem's title and newline joined lines, rowid is POEMS.pid
+CREATE_POEMS_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS POEMS_FTS
+       USING fts5(poem_name, text, tokenize = 'porter unicode61');
+"""
+INSERT_POEMS_FTS = """INSERT INTO POEMS_FTS (rowid, poem_name, text) VALUES (?, ?, ?);"""
+
+# MinHash signature of each poem's (or song's) text, id is POEMS.pid or songs.id.
+# duplicate_of points at the earliest near-duplicate already fingerprinted
+CREATE_FINGERPRINTS = """
+CREATE TABLE IF NOT EXISTS FINGERPRINTS
+       (id INTEGER PRIMARY KEY,
+       signature BLOB,
+       duplicate_of INTEGER);
+"""
+# one row per LSH band of each signature, ids sharing a bucket are candidates
+CREATE_FINGERPRINT_BANDS = """
+CREATE TABLE IF NOT EXISTS FINGERPRINT_BANDS
+       (band INTEGER,
+       bucket INTEGER,
+       id INTEGER REFERENCES FINGERPRINTS(id));
+"""
+CREATE_FINGERPRINT_BUCKETS = """CREATE INDEX IF NOT EXISTS FINGERPRINT_BUCKETS ON FINGERPRINT_BANDS (band, bucket);"""
+
+# crawl frontier of batch runs: every poet, collection and poem url with its state
+# (pending, fetched, parsed, written or failed), retries and the worker holding it
+CREATE_FRONTIER = """
+CREATE TABLE IF NOT EXISTS FRONTIER
+       (url VARCHAR(512) PRIMARY KEY,
+       kind VARCHAR(16),
+       name VARCHAR(256),
+       tags VARCHAR(256),
+       parent VARCHAR(512),
+       shard INTEGER,
+       state VARCHAR(16) DEFAULT 'pending',
+       retries INTEGER DEFAULT 0,
+       next_attempt REAL DEFAULT 0,
+       claimed_by VARCHAR(128),
+       claimed_at REAL,
+       error VARCHAR(256),
+       updated_at REAL);
+"""
+
+INSERT_POEM_STATS = """INSERT OR REPLACE INTO POEM_STATS (pid, poet_id, num_lines, num_chars) VALUES (?, ?, ?, ?);"""
+
+# fills in stats for poems written before POEM_STATS existed, poems without lines are left out
+FILL_POEM_STATS = """
+INSERT INTO POEM_STATS (pid, poet_id, num_lines, num_chars)
+SELECT PM.pid, PM.poet_id, PM.num_lines, sum(LENGTH(L.poem_line))
+FROM POEMS AS PM
+         JOIN LINES L ON L.pid = PM.pid
+WHERE PM.pid > ?
+GROUP BY PM.pid;
+"""
+
+log = logs.get('sql_util')
+
+
+def tag_names(tag_csv):
+    """
+    Returns the stored form of each tag in tag_csv, which keeps the tags quoted
+    """
+    return [f'"{x.strip()}"' for x in tag_csv.split(',') if x.strip()]
+
+
+# schema changes applied in order on top of the CREATE_* tables, PRAGMA user_version
+# records how many of them a database has. Only ever append to this list
+MIGRATIONS = [
+    # 1: secondary indexes for every lookup the scrapers and readers make, unique
+    # poet names, (poem_name, poet_id) and (pid, tag) after merging duplicates
+    [
+        CREATE_POEM_STATS,
+        """CREATE TEMP TABLE POET_DUPES AS
+           SELECT PT.pid AS pid, K.keep AS keep FROM POETS AS PT
+           JOIN (SELECT poet_name, min(pid) AS keep FROM POETS GROUP BY poet_name) AS K
+             ON K.poet_name IS PT.poet_name
+           WHERE PT.pid <> K.keep;""",
+        """UPDATE POEMS SET poet_id = (SELECT keep FROM POET_DUPES WHERE POET_DUPES.pid = POEMS.poet_id)
+           WHERE poet_id IN (SELECT pid FROM POET_DUPES);""",
+        """UPDATE POEM_STATS SET poet_id = (SELECT keep FROM POET_DUPES WHERE POET_DUPES.pid = POEM_STATS.poet_id)
+           WHERE poet_id IN (SELECT pid FROM POET_DUPES);""",
+        """DELETE FROM POETS WHERE pid IN (SELECT pid FROM POET_DUPES);""",
+        """DROP TABLE POET_DUPES;""",
+        """CREATE TEMP TABLE POEM_DUPES AS
+           SELECT PM.pid AS pid, K.keep AS keep FROM POEMS AS PM
+           JOIN (SELECT poem_name, poet_id, min(pid) AS keep FROM POEMS GROUP BY poem_name, poet_id) AS K
+             ON K.poem_name IS PM.poem_name AND K.poet_id IS PM.poet_id
+           WHERE PM.pid <> K.keep;""",
+        """UPDATE TAGS SET pid = (SELECT keep FROM POEM_DUPES WHERE POEM_DUPES.pid = TAGS.pid)
+           WHERE pid IN (SELECT pid FROM POEM_DUPES);""",
+        """DELETE FROM LINES WHERE pid IN (SELECT pid FROM POEM_DUPES);""",
+        """DELETE FROM POEM_STATS WHERE pid IN (SELECT pid FROM POEM_DUPES);""",
+        """DELETE FROM POEMS WHERE pid IN (SELECT pid FROM POEM_DUPES);""",
+        """DROP TABLE POEM_DUPES;""",
+        """DELETE FROM TAGS WHERE tid NOT IN (SELECT min(tid) FROM TAGS GROUP BY pid, name);""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS POETS_NAME ON POETS (poet_name);""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS POEMS_NAME_POET ON POEMS (poem_name, poet_id);""",
+        """CREATE INDEX IF NOT EXISTS POEMS_POET ON POEMS (poet_id);""",
+        """CREATE INDEX IF NOT EXISTS POEMS_URL ON POEMS (url);""",
+        """CREATE INDEX IF NOT EXISTS LINES_PID ON LINES (pid, lid);""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS TAGS_POEM_NAME ON TAGS (pid, name);""",
+        """CREATE INDEX IF NOT EXISTS TAGS_NAME ON TAGS (name, pid);""",
+        """CREATE INDEX IF NOT EXISTS POEM_STATS_POET ON POEM_STATS (poet_id, num_lines, num_chars);""",
+        """CREATE INDEX IF NOT EXISTS POEM_STATS_SIZE ON POEM_STATS (num_lines, num_chars);""",
+    ],
+    # 2: full text search over poem titles and lines
+    [
+        CREATE_POEMS_FTS,
+        """INSERT INTO POEMS_FTS (rowid, poem_name, text)
+           SELECT PM.pid, PM.poem_name,
+                  (SELECT group_concat(poem_line, char(10))
+                   FROM (SELECT poem_line FROM LINES WHERE LINES.pid = PM.pid ORDER BY lid))
+           FROM POEMS AS PM;""",
+    ],
+    # 3: near-duplicate fingerprints, filled in by dedup.py
+    [
+        CREATE_FINGERPRINTS,
+        CREATE_FINGERPRINT_BANDS,
+        CREATE_FINGERPRINT_BUCKETS,
+    ],
+    # 4: resumable crawl frontier, see frontier.py
+    [
+        CREATE_FRONTIER,
+        """CREATE INDEX IF NOT EXISTS FRONTIER_STATE ON FRONTIER (kind, state, next_attempt);""",
+        """CREATE INDEX IF NOT EXISTS FRONTIER_PARENT ON FRONTIER (parent, state);""",
+    ],
+]
+
+
+def schema_version(cursor):
+    """
+    Returns how many MIGRATIONS the database on cursor has
+    """
+    return cursor.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def connect_readonly(path, **kwargs):
+    """
+    Opens the database at path for reading only, so read commands can't change it.
+    A missing file raises sqlite3.OperationalError instead of creating an empty one
+    """
+    return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro', uri=True, **kwargs)
+
+
+def check_schema(cursor):
+    """
+    Raises sqlite3.DatabaseError if the database on cursor lacks any MIGRATIONS,
+    returns its schema version otherwise. Read commands check instead of
+    migrating, migrating is an explicit step
+    """
+    version = schema_version(cursor)
+    if version < len(MIGRATIONS):
+        path = cursor.execute("PRAGMA database_list;").fetchone()[2]
+        raise sqlite3.DatabaseError(f'{path} is at schema {version} of {len(MIGRATIONS)}, '
+                                    f'run `python sql_util.py {path}` to migrate')
+    return version
+
+
+def migrate(cursor):
+    """
+    Applies the MIGRATIONS the database on cursor doesn't have yet, each in its own
+    transaction together with its user_version bump. Returns the new version
+    """
+    version = schema_version(cursor)
+    for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        if cursor.connection.in_transaction:
+            cursor.execute("COMMIT;")
+        cursor.execute("BEGIN;")
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number};")
+        except BaseException:
+            cursor.execute("ROLLBACK;")
+            raise
+        cursor.execute("COMMIT;")
+        log.info(f'⇪ migrated to schema {number}', extra={'schema': number})
+        version = number
+    return version
+
+
+def fill_poem_stats(cursor):
+    """
+    Fills in POEM_STATS rows for any poems newer than the last one with stats.
+    Returns the highest pid with stats
+    """
+    latest = cursor.execute("SELECT coalesce(max(pid), 0) FROM POEM_STATS;").fetchone()[0]
+    newest_poem = cursor.execute("SELECT coalesce(max(pid), 0) FROM POEMS;").fetchone()[0]
+    if newest_poem > latest:
+        cursor.execute(FILL_POEM_STATS, (latest,))
+        cursor.connection.commit()
+        latest = cursor.execute("SELECT coalesce(max(pid), 0) FROM POEM_STATS;").fetchone()[0]
+    return latest
+
+
+# number of records (poems or songs) written per transaction
+GROUP_COMMIT = 1
+
+_pending = 0
+
+
+def set_group_commit(size):
+    """
+    Sets how many records are written per transaction
+    """
+    global GROUP_COMMIT
+    GROUP_COMMIT = max(1, size)
+
+
+def enable_wal(cursor):
+    """
+    Switches the database on cursor to write-ahead logging, which lets readers
+    run alongside the scraper and only syncs on checkpoints
+    """
+    cursor.execute("PRAGMA journal_mode=WAL;")
+    cursor.execute("PRAGMA synchronous=NORMAL;")
+
+
+@contextlib.contextmanager
+def record(cursor):
+    """
+    Writes one record atomically inside the current group transaction and commits
+    the group once GROUP_COMMIT records are pending. A record that raises is rolled
+    back on its own, leaving earlier records of the group intact
+    """
+    global _pending
+    if not cursor.connection.in_transaction:
+        cursor.execute("BEGIN;")
+    cursor.execute("SAVEPOINT record;")
+    try:
+        yield
+    except BaseException:
+        cursor.execute("ROLLBACK TO record;")
+        cursor.execute("RELEASE record;")
+        raise
+    cursor.execute("RELEASE record;")
+    _pending += 1
+    if _pending >= GROUP_COMMIT:
+        commit(cursor)
+
+
+def commit(cursor):
+    """
+    Commits any pending records on cursor
+    """
+    global _pending
+    if cursor.connection.in_transaction:
+        cursor.execute("COMMIT;")
+    _pending = 0
+
+
+def main():
+    """
+    Upgrades the given databases in place to the latest schema
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("databases", nargs="*", default=[DATABASE], help="sqlite files to upgrade")
+    logs.add_log_arguments(parser)
+    args = parser.parse_args()
+    logs.configure_from_args(args)
+    for path in args.databases:
+        conn = sqlite3.connect(path, isolation_level=None)
+        cursor = conn.cursor()
+        before = schema_version(cursor)
+        after = migrate(cursor)
+        fill_poem_stats(cursor)
+        log.info(f'✓ {path} schema {before} → {after}', extra={'schema': after})
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+"""
+Corpus statistics for the poems and songs databases. LINES, or the songs' lyrics,
+are streamed once into NumPy arrays of lengths and ids, and every aggregate is
+computed from those arrays: line length distributions, poems per poet, characters
+and tokens per tag and year histograms. Results are cached next to the database,
+keyed by the size and modification time of its files and whether they are songs
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy as np
+
+from sql_util import DATABASE, connect_readonly
+
+SONGS_DATABASE = "songs.db"
+CHUNK_SIZE = 8192
+# lower edges of the line length histogram in characters, the last bin is open ended
+LENGTH_BINS = (0, 1, 10, 20, 30, 40, 50, 60, 80, 100, 150, 200, 256)
+QUANTILES = (0.5, 0.9, 0.99)
+# groups listed in the report, the cached stats keep them all
+TOP = 15
+
+SELECT_LINES = """SELECT pid, coalesce(poem_line, '') FROM LINES;"""
+SELECT_POEMS = """SELECT pid, poet_id, year FROM POEMS ORDER BY pid;"""
+SELECT_POETS = """SELECT pid, poet_name FROM POETS;"""
+SELECT_TAGS = """SELECT pid, name FROM TAGS;"""
+SELECT_SONGS = """SELECT id, artist, year, coalesce(lyrics, '') FROM songs ORDER BY id;"""
+
+YEAR = re.compile(r'\d{4}')
+
+
+def cache_path(database):
+    return database + '.stats.json'
+
+
+def db_state(database, songs=False):
+    """
+    Returns the size and modification time of the database and its write-ahead
+    log, which change with every commit, and the kind of stats computed from it
+    """
+    state = {'mode': 'songs' if songs else 'poems'}
+    for suffix in ('', '-wal'):
+        path = database + suffix
+        if os.path.exists(path):
+            info = os.stat(path)
+            state[suffix or 'db'] = [info.st_size, info.st_mtime_ns]
+    return state
+
+
+def _lengths(texts):
+    """
+    Returns the character and whitespace separated token counts of texts as arrays
+    """
+    chars = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    tokens = np.fromiter((len(text.split()) for text in texts), dtype=np.int64, count=len(texts))
+    return chars, tokens
+
+
+def _concat(parts, dtype=np.int64):
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+
+def stream_lines(cursor):
+    """
+    Reads LINES once, CHUNK_SIZE rows at a time, into arrays of the poem id,
+    character count and token count of every line
+    """
+    pids, chars, tokens = [], [], []
+    cursor.execute(SELECT_LINES)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        pids.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+        line_chars, line_tokens = _lengths([row[1] for row in rows])
+        chars.append(line_chars)
+        tokens.append(line_tokens)
+    return _concat(pids), _concat(chars), _concat(tokens)
+
+
+def stream_lyrics(cursor):
+    """
+    Reads the songs once into arrays of song ids, artists and years, and of the
+    song index, character count and token count of every lyric line
+    """
+    ids, artists, years = [], [], []
+    song_index, chars, tokens = [], [], []
+    cursor.execute(SELECT_SONGS)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        for song_id, artist, year, lyrics in rows:
+            lines = lyrics.split('\n')
+            song_index.append(np.full(len(lines), len(ids), dtype=np.int64))
+            line_chars, line_tokens = _lengths(lines)
+            chars.append(line_chars)
+            tokens.append(line_tokens)
+            ids.append(song_id)
+            artists.append(artist or '')
+            years.append(year)
+    return (np.array(ids, dtype=np.int64), np.array(artists, dtype=object), _year_array(years),
+            _concat(song_index), _concat(chars), _concat(tokens))
+
+
+def _year_array(years):
+    """
+    Returns years as an int array, 0 where a year is missing. Poem years are kept as
+    text like '(1992)'
+    """
+    def parse(year):
+        if isinstance(year, int):
+            return year
+        match = YEAR.search(str(year)) if year else None
+        return int(match.group(0)) if match else 0
+    return np.fromiter((parse(year) for year in years), dtype=np.int64, count=len(years))
+
+
+def distribution(values):
+    """
+    Returns the count, total, mean and quantiles of an array of counts
+    """
+    if not len(values):
+        return {'count': 0, 'total': 0, 'mean': 0.0}
+    summary = {'count': int(len(values)), 'total': int(values.sum()), 'mean': float(values.mean()),
+               'max': int(values.max())}
+    for q, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+        summary[f'p{int(q * 100)}'] = float(value)
+    return summary
+
+
+def length_histogram(chars):
+    """
+    Returns the number of lines in each LENGTH_BINS bin, labelled by its range
+    """
+    edges = np.array(LENGTH_BINS + (np.iinfo(np.int64).max,))
+    counts, _ = np.histogram(chars, bins=edges)
+    labels = [f'{low}-{high - 1}' if high - 1 > low else f'{low}' for low, high in zip(LENGTH_BINS, LENGTH_BINS[1:])]
+    labels.append(f'{LENGTH_BINS[-1]}+')
+    return dict(zip(labels, (int(count) for count in counts)))
+
+
+def year_histogram(years):
+    """
+    Returns the number of entries per decade, and how many have no year
+    """
+    known = years[years > 0]
+    decades, counts = np.unique(known // 10 * 10, return_counts=True)
+    histogram = {f'{decade}s': int(count) for decade, count in zip(decades, counts)}
+    histogram['unknown'] = int(len(years) - len(known))
+    return histogram
+
+
+def by_group(names, chars, tokens, lines):
+    """
+    Returns entries, lines, characters and tokens per group, largest first. names
+    holds the group of each entry, chars, tokens and lines the entry's totals
+    """
+    if not len(names):
+        return {}
+    groups, inverse, counts = np.unique(names, return_inverse=True, return_counts=True)
+    sums = [np.bincount(inverse, weights=values, minlength=len(groups)) for values in (lines, chars, tokens)]
+    order = np.lexsort((groups, -counts))
+    return {str(groups[i]): {'entries': int(counts[i]), 'lines': int(sums[0][i]), 'chars': int(sums[1][i]),
+                             'tokens': int(sums[2][i])}
+            for i in order}
+
+
+def _per_entry(line_entry, chars, tokens, entries):
+    """
+    Sums the line arrays into per entry line, character and token totals
+    """
+    return (np.bincount(line_entry, minlength=entries),
+            np.bincount(line_entry, weights=chars, minlength=entries).astype(np.int64),
+            np.bincount(line_entry, weights=tokens, minlength=entries).astype(np.int64))
+
+
+def poem_stats(cursor):
+    """
+    Computes every poem aggregate from one pass over LINES and the small POEMS,
+    POETS and TAGS tables
+    """
+    line_pids, chars, tokens = stream_lines(cursor)
+    poems = cursor.execute(SELECT_POEMS).fetchall()
+    pids = np.fromiter((row[0] for row in poems), dtype=np.int64, count=len(poems))
+    poet_ids = np.fromiter((row[1] or 0 for row in poems), dtype=np.int64, count=len(poems))
+    years = _year_array([row[2] for row in poems])
+
+    # lines of poems that are gone are left out
+    line_poem = np.searchsorted(pids, line_pids)
+    kept = line_poem < len(pids)
+    kept[kept] = pids[line_poem[kept]] == line_pids[kept]
+    line_poem, chars, tokens = line_poem[kept], chars[kept], tokens[kept]
+    poem_lines, poem_chars, poem_tokens = _per_entry(line_poem, chars, tokens, len(pids))
+    with_lines = poem_lines > 0
+
+    poets = {pid: (name or '').strip() for pid, name in cursor.execute(SELECT_POETS)}
+    poet_names = np.array([poets.get(int(poet_id), '') for poet_id in poet_ids], dtype=object)
+
+    tags = cursor.execute(SELECT_TAGS).fetchall()
+    tag_pids = np.fromiter((row[0] for row in tags), dtype=np.int64, count=len(tags))
+    tag_poem = np.minimum(np.searchsorted(pids, tag_pids), max(len(pids) - 1, 0))
+    tagged = pids[tag_poem] == tag_pids if len(pids) else np.zeros(len(tags), dtype=bool)
+    tag_names = np.array([row[1] for row in tags], dtype=object)[tagged]
+    tag_poem = tag_poem[tagged]
+
+    return {
+        'lines': {'chars': distribution(chars), 'tokens': distribution(tokens), 'histogram': length_histogram(chars)},
+        'poems': {'count': int(len(pids)), 'with_lines': int(with_lines.sum()),
+                  'lines': distribution(poem_lines[with_lines]), 'chars': distribution(poem_chars[with_lines]),
+                  'tokens': distribution(poem_tokens[with_lines])},
+        'poets': by_group(poet_names, poem_chars, poem_tokens, poem_lines),
+        'tags': by_group(tag_names, poem_chars[tag_poem], poem_tokens[tag_poem], poem_lines[tag_poem]),
+        'years': year_histogram(years),
+    }
+
+
+def song_stats(cursor):
+    """
+    Computes the song aggregates from one pass over the songs table
+    """
+    ids, artists, years, line_song, chars, tokens = stream_lyrics(cursor)
+    song_lines, song_chars, song_tokens = _per_entry(line_song, chars, tokens, len(ids))
+    return {
+        'lines': {'chars': distribution(chars), 'tokens': distribution(tokens), 'histogram': length_histogram(chars)},
+        'songs': {'count': int(len(ids)), 'lines': distribution(song_lines), 'chars': distribution(song_chars),
+                  'tokens': distribution(song_tokens)},
+        'artists': by_group(artists, song_chars, song_tokens, song_lines),
+        'years': year_histogram(years),
+    }
+
+
+def corpus_stats(database, songs=False, fresh=False):
+    """
+    Returns the stats of database, from its cache file if the database hasn't
+    changed since they were computed
+    """
+    path = cache_path(database)
+    state = db_state(database, songs)
+    if not fresh and os.path.exists(path):
+        with open(path) as f:
+            cached = json.load(f)
+        if cached.get('state') == state:
+            return cached['stats']
+        print(f'↻ {database} changed since its stats were cached', file=sys.stderr)
+
+    start = time.perf_counter()
+    # read only, so closing the connection can't checkpoint the log and change the state
+    conn = connect_readonly(database)
+    try:
+        stats = song_stats(conn.cursor()) if songs else poem_stats(conn.cursor())
+    finally:
+        conn.close()
+    # on stderr, so --json output stays parseable
+    print(f'⚙ computed stats of {database} in {time.perf_counter() - start:.2f}s', file=sys.stderr)
+
+    # a commit during the pass leaves the stats uncached
+    if db_state(database, songs) == state:
+        with open(path, 'w') as f:
+            json.dump({'database': os.path.abspath(database), 'state': state,
+                       'computed_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stats': stats}, f, indent=2)
+    return stats
+
+
+def _summary(name, values):
+    if not values.get('count'):
+        return f'{name:<16}none'
+    return (f"{name:<16}{values['count']:>8} total {values['total']:>10}  mean {values['mean']:8.1f}  "
+            f"p50 {values['p50']:7.0f}  p90 {values['p90']:7.0f}  p99 {values['p99']:7.0f}  max {values['max']:7}")
+
+
+def report(stats, top=TOP):
+    """
+    Returns the stats as lines of text
+    """
+    out = []
+    entries = 'songs' if 'songs' in stats else 'poems'
+    groups = [('artists', 'artists')] if entries == 'songs' else [('poets', 'poets'), ('tags', 'tags')]
+    out.append(f"✓ {stats[entries]['count']} {entries}")
+    for name, values in stats[entries].items():
+        if isinstance(values, dict):
+            out.append(_summary(f'{name} per {entries[:-1]}', values))
+    out.append(_summary('chars per line', stats['lines']['chars']))
+    out.append(_summary('tokens per line', stats['lines']['tokens']))
+    out.append('\nline lengths')
+    total = max(1, sum(stats['lines']['histogram'].values()))
+    for label, count in stats['lines']['histogram'].items():
+        out.append(f"  {label:>8} {count:>8} {'█' * round(40 * count / total)}")
+    for key, title in groups:
+        out.append(f"\n{title} [{len(stats[key])}], top {min(top, len(stats[key]))}")
+        for name, values in list(stats[key].items())[:top]:
+            out.append(f"  {name[:32]:<32} {values['entries']:>6} {entries}  {values['lines']:>8} lines  "
+                       f"{values['chars']:>10} chars  {values['tokens']:>9} tokens")
+    out.append('\nyears')
+    for decade, count in stats['years'].items():
+        out.append(f'  {decade:>8} {count:>8}')
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--database", type=str, help="database to describe, poems.db or songs.db by default")
+    parser.add_argument("--songs", action="store_true", help="database is a songs.db")
+    parser.add_argument("--fresh", action="store_true", help="recompute even if the cached stats are current")
+    parser.add_argument("--top", type=int, default=TOP, help="poets, tags or artists to list")
+    parser.add_argument("--json", action="store_true", help="print the stats as JSON")
+
+    args = parser.parse_args()
+    database = args.database or (SONGS_DATABASE if args.songs else DATABASE)
+    if not os.path.isfile(database):
+        parser.error(f"no database at {database}")
+    try:
+        stats = corpus_stats(database, args.songs, args.fresh)
+    except sqlite3.OperationalError as err:
+        parser.error(f"can't read {'songs' if args.songs else 'poems'} from {database}: {err}")
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print('\n'.join(report(stats, args.top)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Writes poets, poems, their lines, stats, full text and tags to the poems database.
+Kept apart from scrape.py so the SQL layer loads without the scraping stack
+"""
+
+from __future__ import print_function
+
+import dedup
+import logs
+import metrics
+from sql_util import (CREATE_LINES, CREATE_POEMS, CREATE_POETS, CREATE_TAGS, INSERT_POEM_STATS, INSERT_POEMS_FTS,
+                      fill_poem_stats, migrate, record, tag_names)
+
+INSERT_LINE = """INSERT INTO LINES (lid, pid, poem_line) VALUES (?, ?, ?);"""
+INSERT_TAG = """INSERT INTO TAGS (pid, name) VALUES (?, ?);"""
+INSERT_POEM = """INSERT INTO POEMS (poem_name, poet_id, num_lines%s) VALUES (?, ?, ?%s);"""
+INSERT_POET_DEAD = """INSERT INTO POETS (poet_name, born, died) VALUES (?, ?, ?);"""
+INSERT_POET_ALIVE = """INSERT INTO POETS (poet_name, born) VALUES (?, ?);"""
+INSERT_POET = """INSERT INTO POETS (poet_name) VALUES (?);"""
+
+SELECT_POET_ID = """SELECT PID FROM POETS WHERE poet_name = ?;"""
+SELECT_POET_EXISTS = """SELECT * FROM POETS WHERE poet_name = ?;"""
+
+SELECT_POEM_ID = """SELECT PID FROM POEMS WHERE poem_name = ? AND poet_id = ?;"""
+SELECT_POEM_EXISTS = """SELECT * FROM POEMS WHERE poem_name = ? AND poet_id = ?;"""
+
+SELECT_TAG_EXISTS = """SELECT * FROM TAGS WHERE name = ?;"""
+SELECT_POEM_TAG_EXISTS = """SELECT * FROM TAGS WHERE pid = ? AND name = ?;"""
+
+SELECT_POEM_URLS = """SELECT url FROM POEMS WHERE url IS NOT NULL;"""
+SELECT_POEM_ID_BY_URL = """SELECT pid FROM POEMS WHERE url = ?;"""
+
+# urls of poems already in the database, loaded once by load_poem_urls
+STORED_URLS = None
+
+log = logs.get('store')
+
+
+def create_tables(cursor):
+    """
+    Sets up the tables on cursor if they don't already exist
+    """
+    cursor.execute(CREATE_POETS)
+    cursor.execute(CREATE_POEMS)
+    cursor.execute(CREATE_LINES)
+    cursor.execute(CREATE_TAGS)
+    migrate(cursor)
+    fill_poem_stats(cursor)
+
+
+def drop_tables(cursor):
+    for table in ['POETS', 'POEMS', 'LINES', 'TAGS', 'POEM_STATS', 'POEMS_FTS', 'FINGERPRINTS', 'FINGERPRINT_BANDS',
+                  'FRONTIER']:
+        cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+def write_poem(poem, poet_id, cursor, tag_csv=None):
+    res = poem_exists(poem.title, poet_id, cursor)
+    if res:
+        log.info(f"↛ {poem.title} [exists]\n", extra={'url': poem.url})
+        return
+    lines = poem.lines
+    text = poem.full_text()
+    with record(cursor):
+        poem_id = create_poem(poem, poet_id, cursor)
+        add_lines(poem_id, lines, cursor)
+        if lines:
+            cursor.execute(INSERT_POEM_STATS, (poem_id, poet_id, len(lines), sum(len(l) for l in lines)))
+        cursor.execute(INSERT_POEMS_FTS, (poem_id, poem.title, text))
+        duplicate_of = dedup.fingerprint(cursor, poem_id, text)
+        if tag_csv:
+            tag_poem(poem_id, tag_csv, cursor)
+    # the poem, its lines, stats and full text rows
+    metrics.count('db_rows', 2 + len(lines) + bool(lines))
+    if poem.url and STORED_URLS is not None:
+        STORED_URLS.add(poem.url)
+    if duplicate_of is not None:
+        log.info(f'≈ {poem.title} [near-duplicate of {duplicate_of}]\n',
+                 extra={'pid': poem_id, 'duplicate_of': duplicate_of})
+    else:
+        log.info(f'✓ {poem.title}\n', extra={'pid': poem_id, 'url': poem.url})
+
+
+def tag_poem(poem_id, tag_csv, cursor):
+    """
+    Adds the tags in tag_csv to poem_id unless it already has them
+    """
+    for name in tag_names(tag_csv):
+        if not cursor.execute(SELECT_POEM_TAG_EXISTS, (poem_id, name)).fetchall():
+            add_tag(poem_id, name, cursor)
+
+
+def load_poem_urls(cursor):
+    """
+    Returns the set of poem urls stored in cursor, loading it on first use
+    """
+    global STORED_URLS
+    if STORED_URLS is None:
+        STORED_URLS = {row[0] for row in cursor.execute(SELECT_POEM_URLS)}
+    return STORED_URLS
+
+
+def poet_exists(poet_name, cursor):
+    """
+    Returns true if poet_name exists in cursor
+    """
+    return cursor.execute(SELECT_POET_EXISTS, (poet_name,)).fetchall()
+
+
+def create_poet(poet_name, years, cursor):
+    """
+    Creates poet_name with years in cursor if not exists and returns its id
+    """
+    existing = poet_exists(poet_name, cursor)
+    if existing:
+        return existing[0][0]
+    if years:
+        born = years[0]
+        if len(years) > 1:
+            died = years[1]
+            cursor.execute(INSERT_POET_DEAD, (poet_name, born, died))
+        else:
+            cursor.execute(INSERT_POET_ALIVE, (poet_name, born))
+    else:
+        cursor.execute(INSERT_POET, (poet_name,))
+    return cursor.lastrowid
+
+
+def create_poem(poem, poet_id, cursor):
+    """
+    Creates an entry for poem of poet_id in cursor
+    """
+    query_names = ""
+    query_values = ""
+    num_lines = poem.num_lines()
+    params = (poem.title, poet_id, num_lines)
+
+    # TODO: this can be factored out
+    if poem.url:
+        query_names = query_names + ", url"
+        query_values = query_values + ", ?"
+        params = params + (poem.url,)
+    if poem.source:
+        query_names = query_names + ", source"
+        query_values = query_values + ", ?"
+        params = params + (poem.source,)
+    if poem.year:
+        query_names = query_names + ", year"
+        query_values = query_values + ", ?"
+        params = params + (poem.year,)
+    if poem.translator:
+        query_names = query_names + ", translator"
+        query_values = query_values + ", ?"
+        params = params + (poem.translator,)
+
+    query = INSERT_POEM % (query_names, query_values)
+    cursor.execute(query, params)
+    return cursor.lastrowid
+
+
+def poem_exists(poem_name, poet_id, cursor):
+    """
+    Returns True if poem_name and poet_id exist in cursor
+    """
+    return cursor.execute(SELECT_POEM_EXISTS, (poem_name, poet_id)).fetchall()
+
+
+def add_line(lid, poem_id, line, cursor):
+    """
+    Adds line with id lid pid and value line to cursor
+    """
+    cursor.execute(INSERT_LINE, (lid, poem_id, line))
+
+
+def add_lines(poem_id, lines, cursor):
+    """
+    Adds all lines of poem_id to cursor, numbered from 0
+    """
+    cursor.executemany(INSERT_LINE, [(lid, poem_id, line) for lid, line in enumerate(lines)])
+
+
+def add_tag(poem_id, tag_name, cursor):
+    """
+    Adds tag to a poem
+    """
+    cursor.execute(INSERT_TAG, (poem_id, tag_name))